@@ -0,0 +1,58 @@
+import logging
+
+from django.utils.functional import SimpleLazyObject, empty
+
+logger = logging.getLogger(__name__)
+
+
+class LazyBadge(SimpleLazyObject):
+    """
+    Lazy value displayed in the navbar (e.g. the number of unread notifications).
+
+    The query computing the value is only executed when the value is used, typically when a template renders the
+    navbar. Requests that never render it (htmx fragments, JSON endpoints, redirects...) do not pay for the query.
+    """
+
+    @property
+    def is_evaluated(self):
+        return self._wrapped is not empty
+
+
+def set_lazy_badge(request, name, func):
+    """
+    Set a lazy badge on request.user and register it for the instrumentation of LazyBadgeInstrumentationMiddleware.
+
+    :param request: The request
+    :param name: The name of the attribute to set on request.user
+    :param func: The function computing the value, called at most once
+    """
+    badge = LazyBadge(func)
+    setattr(request.user, name, badge)
+
+    if not hasattr(request, 'lazy_badges'):
+        request.lazy_badges = {}
+    request.lazy_badges[name] = badge
+
+
+class LazyBadgeInstrumentationMiddleware:
+    """
+    Logs, for every request, how many badge queries were skipped because the badges were never used.
+    It must be placed before the middlewares setting the badges so that it sees the response after the rendering.
+    The logs are emitted at the DEBUG level of the ProjectOpenDebate.common.badges logger.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        lazy_badges = getattr(request, 'lazy_badges', None)
+        if lazy_badges and logger.isEnabledFor(logging.DEBUG):
+            skipped = [name for name, badge in lazy_badges.items() if not badge.is_evaluated]
+            view_name = request.resolver_match.view_name if request.resolver_match else request.path
+            logger.debug(
+                f"{view_name}: {len(skipped)}/{len(lazy_badges)} badge queries skipped ({', '.join(skipped) or 'none'})"
+            )
+
+        return response
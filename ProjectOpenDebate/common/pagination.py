@@ -0,0 +1,143 @@
+import datetime
+import json
+
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+KEYSET_CURSOR_SALT = 'ProjectOpenDebate.common.pagination.keyset'
+
+
+class KeysetCursorEncoder(DjangoJSONEncoder):
+    """
+    JSON encoder keeping the full precision of the datetimes and times. DjangoJSONEncoder truncates them to the
+    millisecond, in which case the cursor would no longer match the last object of the page and the objects between the
+    truncated value and the actual one would be skipped.
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetCursorSerializer:
+    """
+    Serializer used to sign the cursors. Unlike the default signing serializer, it supports dates and datetimes.
+    """
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'), cls=KeysetCursorEncoder).encode('latin-1')
+
+    def loads(self, data):
+        return json.loads(data.decode('latin-1'))
+
+
+class KeysetPage:
+    """
+    A page of objects fetched using keyset pagination.
+
+    It exposes the parts of django.core.paginator.Page used by the templates (iteration, length and has_next) and
+    replaces the page numbers by an opaque cursor pointing after the last object of the page.
+
+    The boundary_object is the first object of the next page (or None). It is fetched anyway to know whether there is
+    a next page and can be used to compute values that depend on the neighbour of the last object of the page.
+    """
+
+    def __init__(self, object_list, has_next, next_cursor, is_first, boundary_object=None):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.next_cursor = next_cursor
+        self.is_first = is_first
+        self.boundary_object = boundary_object
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __repr__(self):
+        return f"<KeysetPage of {len(self)} objects (first={self.is_first}, has_next={self.has_next})>"
+
+
+def encode_cursor(values):
+    return signing.dumps(list(values), salt=KEYSET_CURSOR_SALT, serializer=KeysetCursorSerializer)
+
+
+def decode_cursor(cursor, num_values):
+    """
+    Decode a cursor created by encode_cursor.
+
+    :param cursor: The cursor to decode
+    :param num_values: The expected number of values in the cursor
+    :return: The list of values or None if the cursor is invalid (e.g. it was tampered with)
+    """
+    try:
+        values = signing.loads(cursor, salt=KEYSET_CURSOR_SALT, serializer=KeysetCursorSerializer)
+    except signing.BadSignature:
+        return None
+
+    if not isinstance(values, list) or len(values) != num_values:
+        return None
+
+    return values
+
+
+def keyset_filter(ordering, values):
+    """
+    Build the condition selecting the rows that come after the given values in the given ordering.
+
+    For an ordering (-a, -b) and values (x, y), this is `a <= x AND (a < x OR (a = x AND b < y))`. The redundant
+    condition on the first field lets the database use it as an index range condition.
+
+    :param ordering: The fields of the ordering, prefixed by '-' when descending
+    :param values: The values of these fields for the last object of the previous page
+    :return: A Q object
+    """
+    fields = [(field.lstrip('-'), 'lt' if field.startswith('-') else 'gt') for field in ordering]
+
+    after = Q()
+    for i, (field, lookup) in enumerate(fields):
+        ties = {previous_field: value for (previous_field, _), value in zip(fields[:i], values)}
+        after |= Q(**ties, **{f'{field}__{lookup}': values[i]})
+
+    first_field, first_lookup = fields[0]
+    return Q(**{f'{first_field}__{first_lookup}e': values[0]}) & after
+
+
+def paginate_keyset(queryset, ordering, cursor=None, page_size=10):
+    """
+    Get a page of the queryset using keyset pagination. Unlike OFFSET pagination, the cost of fetching a page does not
+    depend on how deep the page is, as long as an index matches the ordering.
+
+    The ordering must be total (e.g. end with the primary key) for the pages to be stable. An invalid cursor is
+    treated as the first page, like Paginator.get_page does with invalid page numbers.
+
+    :param queryset: The queryset to paginate
+    :param ordering: The fields to order by, prefixed by '-' when descending, e.g. ('-date_added', '-id')
+    :param cursor: The cursor of the page to get, as given by KeysetPage.next_cursor, or None for the first page
+    :param page_size: The number of objects per page
+    :return: A KeysetPage
+    """
+    values = decode_cursor(cursor, len(ordering)) if cursor else None
+
+    queryset = queryset.order_by(*ordering)
+    if values is not None:
+        queryset = queryset.filter(keyset_filter(ordering, values))
+
+    # Fetch one more object to know if there is a next page
+    object_list = list(queryset[:page_size + 1])
+    has_next = len(object_list) > page_size
+    boundary_object = object_list[page_size] if has_next else None
+    object_list = object_list[:page_size]
+
+    next_cursor = None
+    if has_next:
+        last_object = object_list[-1]
+        next_cursor = encode_cursor(getattr(last_object, field.lstrip('-')) for field in ordering)
+
+    return KeysetPage(object_list, has_next, next_cursor, is_first=values is None, boundary_object=boundary_object)
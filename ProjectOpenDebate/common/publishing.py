@@ -0,0 +1,77 @@
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from outbox.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# The Postgres channel notified when new events are written to the outbox, see the relay_outbox command
+OUTBOX_NOTIFY_CHANNEL = 'outbox_events'
+
+
+def relay_events(event_ids):
+    """
+    Send the given events of the outbox right away, in this process. It is registered as an on_commit callback when
+    OUTBOX_RELAY_INLINE is set, so that the events written by a transaction are sent without waiting for the
+    relay_outbox command.
+
+    Only the events of the transaction are sent, within OUTBOX_RELAY_INLINE_TIMEOUT seconds, so a slow or unavailable
+    channel layer only delays the request by that much. The events that could not be sent stay in the outbox and are
+    sent by the relay_outbox command.
+
+    :param event_ids: The ids of the events written by the transaction
+    """
+    try:
+        OutboxEvent.objects.relay_events(event_ids, timeout=settings.OUTBOX_RELAY_INLINE_TIMEOUT)
+    except Exception as e:
+        logger.warning(f'Could not relay {len(event_ids)} outbox events inline, they will be sent by the relay: {e}')
+
+
+def publish_many(events):
+    """
+    Publish events to the channel layer through the outbox.
+
+    The events are written to the outbox table in the current transaction (or right away outside a transaction), so
+    they are only sent if the changes they are about are committed, and they are not lost if the process dies after
+    the commit: the relay_outbox command sends them once committed and marks them as published. It is woken up by a
+    NOTIFY, which Postgres only delivers when the transaction commits. With OUTBOX_RELAY_INLINE, the events are also
+    sent right after the commit by this process, see relay_events.
+
+    The events are sent at least once and roughly in the order of their ids, but the order is not guaranteed: several
+    relays send their batches concurrently, and the ids do not follow the commit order of concurrent transactions. The
+    events of a same call are written in order and are usually sent in the same batch.
+
+    Unlike sending in an on_commit callback, the events are discarded along with a rolled back savepoint.
+
+    :param events: A list of (group, message) tuples, as given to channel_layer.group_send. The messages must be JSON
+        serializable.
+    """
+    if not events:
+        return
+
+    outbox_events = OutboxEvent.objects.bulk_create(
+        OutboxEvent(group=group, message=message) for group, message in events
+    )
+
+    with transaction.get_connection().cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [OUTBOX_NOTIFY_CHANNEL, ''])
+
+    if settings.OUTBOX_RELAY_INLINE:
+        # Each call relays its own events, so the callback is discarded along with its events by a rolled back savepoint
+        event_ids = [outbox_event.id for outbox_event in outbox_events]
+        transaction.on_commit(lambda: relay_events(event_ids))
+
+
+def publish(group, message):
+    """
+    Publish a single event to the channel layer, see publish_many.
+    """
+    publish_many([(group, message)])
+
+
+# To publish from the consumers
+apublish_many = database_sync_to_async(publish_many)
+apublish = database_sync_to_async(publish)
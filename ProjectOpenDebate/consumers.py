@@ -1,11 +1,26 @@
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from django.shortcuts import resolve_url
 
+from ProjectOpenDebate.common.publishing import apublish
+
 
 def get_user_group_name(consumer_class_name: str, user_id: int):
     return f'{consumer_class_name}_{user_id}'
 
 
+def get_redirect_event(to, *args, **kwargs):
+    """
+    Get the event redirecting the user to the specified URL, see CustomBaseConsumer.redirect.
+    """
+    return {
+        'type': 'send.json',
+        'event_type': 'redirect',
+        'data': {
+            'url': resolve_url(to, *args, **kwargs)
+        }
+    }
+
+
 class CustomBaseConsumer(AsyncJsonWebsocketConsumer):
     """
     This is the base consumer for this project. It forces the user to be authenticated before connecting.
@@ -32,16 +47,6 @@ class CustomBaseConsumer(AsyncJsonWebsocketConsumer):
         """
         Redirects the user to the specified URL.
         """
-        url = resolve_url(to, *args, **kwargs)
         group = get_user_group_name(self.__class__.__name__, user_id)
 
-        await self.channel_layer.group_send(
-            group,
-            {
-                'type': 'send.json',
-                'event_type': 'redirect',
-                'data': {
-                    'url': url
-                }
-            }
-        )
+        await apublish(group, get_redirect_event(to, *args, **kwargs))
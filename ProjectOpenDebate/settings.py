@@ -59,7 +59,8 @@ INSTALLED_APPS = [
     'discussion.apps.DiscussionConfig',
     'debateme.apps.DebatemeConfig',
     'notifications.apps.NotificationsConfig',
-    'pairing.apps.PairingConfig'
+    'pairing.apps.PairingConfig',
+    'outbox.apps.OutboxConfig',
 ]
 
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
@@ -79,6 +80,7 @@ MIDDLEWARE = [
     'debug_toolbar.middleware.DebugToolbarMiddleware',
     'allauth.account.middleware.AccountMiddleware',
     'django_htmx.middleware.HtmxMiddleware',
+    'ProjectOpenDebate.common.badges.LazyBadgeInstrumentationMiddleware',
     'notifications.middleware.NotificationMiddleware',
     'discussion.middleware.MessageMiddleware',
     'pairing.middleware.PairingMiddleware'
@@ -122,6 +124,16 @@ DATABASES = {
 }
 
 # Channel layer definitions
+REDIS_URL = f"redis://:{env('REDIS_PASSWORD')}@{env('REDIS_HOST')}:{env('REDIS_PORT')}/{env('REDIS_DB')}"
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": "opendebate",
+    }
+}
+
 CHANNEL_LAYERS = {
     # "default": {
     #     "BACKEND": "channels.layers.InMemoryChannelLayer"
@@ -129,13 +141,13 @@ CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [f"redis://:{env('REDIS_PASSWORD')}@{env('REDIS_HOST')}:{env('REDIS_PORT')}/{env('REDIS_DB')}"]
+            "hosts": [REDIS_URL]
         }
     }
 }
 
 # Celery settings
-CELERY_BROKER_URL = f"redis://:{env('REDIS_PASSWORD')}@{env('REDIS_HOST')}:{env('REDIS_PORT')}/{env('REDIS_DB')}"
+CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = 'django-db'  # Should we store in redis instead?
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_RESULT_SERIALIZER = 'json'
@@ -212,11 +224,59 @@ ADMINS = [
 # Pairing settings
 PAIRING_KEEPALIVE_INTERVAL = 10  # seconds
 PAIRING_REQUEST_EXPIRY_SECONDS = 30  # seconds
+PAIRING_SWEEP_INTERVAL = 15  # seconds, how often the expired active requests are swept
+PAIRING_PASSIVE_INTERVAL = 60  # seconds, how often the passive requests are paired
+PAIRING_PASSIVE_NUM_SHARDS = 8  # maximum number of concurrent subtasks per passive pairing run
+PAIRING_PASSIVE_LOCK_TIMEOUT = 10 * 60  # seconds, after which a stuck run no longer prevents the next ones
+
+# Notification settings
+# Read notifications are pruned once they are older than the retention period or beyond the most recent ones of a user
+# Unread notifications are never pruned
+NOTIFICATION_RETENTION_DAYS = 90
+NOTIFICATION_MAX_READ_PER_USER = 200
+NOTIFICATION_PRUNE_BATCH_SIZE = 1000
+
+# Outbox settings
+# The WebSocket events are written to the outbox and sent once committed (see ProjectOpenDebate.common.publishing)
+# The relay_outbox command must be running for the WebSocket events to be sent, see the README
+# With OUTBOX_RELAY_INLINE, the process that wrote the events also tries to send them right after the commit, for at
+# most OUTBOX_RELAY_INLINE_TIMEOUT seconds. This saves the relay round trip but makes the requests wait on the channel
+# layer, so it is disabled by default.
+OUTBOX_RELAY_INLINE = env.bool("OUTBOX_RELAY_INLINE", default=False)
+OUTBOX_RELAY_INLINE_TIMEOUT = 0.2  # seconds
+OUTBOX_RELAY_BATCH_SIZE = 500
+OUTBOX_RELAY_POLL_INTERVAL = 5  # seconds, in case a NOTIFY is missed
+OUTBOX_RETENTION_HOURS = 24  # published events are kept for debugging and then pruned
 
 # Celery Beat Tasks
 CELERY_BEAT_SCHEDULE = {
     "passive_pairing": {
         "task": "pairing.tasks.try_pairing_passive_requests",
-        "schedule": crontab(minute="0"),
+        "schedule": PAIRING_PASSIVE_INTERVAL,
+    },
+    "sweep_expired_pairing_requests": {
+        "task": "pairing.tasks.sweep_expired_pairing_requests",
+        "schedule": PAIRING_SWEEP_INTERVAL,
+    },
+    "refresh_debate_rankings": {
+        "task": "debate.tasks.refresh_debate_rankings",
+        "schedule": crontab(minute="*/10"),
+    },
+    "refresh_related_debates": {
+        "task": "debate.tasks.refresh_related_debates",
+        "schedule": crontab(minute="30"),
+    },
+    "prune_notifications": {
+        "task": "notifications.tasks.prune_notifications",
+        "schedule": crontab(minute="15", hour="3"),
+    },
+    "rebuild_related_debates": {
+        "task": "debate.tasks.refresh_related_debates",
+        "schedule": crontab(minute="45", hour="4"),
+        "kwargs": {"only_missing": False},
+    },
+    "prune_outbox_events": {
+        "task": "outbox.tasks.prune_outbox_events",
+        "schedule": crontab(minute="5"),
     },
 }
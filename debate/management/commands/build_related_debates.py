@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from debate.models import RelatedDebate, NUM_RELATED_DEBATES
+
+
+class Command(BaseCommand):
+    help = 'Computes the related debates suggested on the debate page.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only-missing', action='store_true',
+                            help='Only process the debates whose related debates were never computed')
+        parser.add_argument('--num-related', type=int, default=NUM_RELATED_DEBATES,
+                            help='Number of related debates to store per debate')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        if options['only_missing']:
+            num_debates = RelatedDebate.objects.rebuild_missing(num_related=options['num_related'])
+        else:
+            num_debates = RelatedDebate.objects.rebuild(num_related=options['num_related'])
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Computed the related debates of {num_debates} debates in {elapsed:.2f}s.'
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from debate.models import Debate
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the vote and stance counters of every debate from scratch and reports the drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the drift, do not fix it')
+        parser.add_argument('--verbose-drift', action='store_true', help='Print the drift of every debate')
+
+    def handle(self, *args, **options):
+        drift = Debate.objects.rebuild_counters(dry_run=options['dry_run'])
+
+        if options['verbose_drift']:
+            for debate_id, debate_drift in drift.items():
+                fields = ', '.join(f'{field}: {stored} -> {actual}' for field, (stored, actual) in debate_drift.items())
+                self.stdout.write(f'Debate {debate_id}: {fields}')
+
+        # Summarize the drift per counter
+        drift_per_field = {}
+        for debate_drift in drift.values():
+            for field, (stored, actual) in debate_drift.items():
+                drift_per_field[field] = drift_per_field.get(field, 0) + abs(actual - stored)
+
+        for field, total_drift in drift_per_field.items():
+            self.stdout.write(f'{field}: total drift of {total_drift}')
+
+        action = 'would be fixed' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(f'{len(drift)} debates with drifted counters {action}.'))
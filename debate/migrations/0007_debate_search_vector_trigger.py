@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# The search vector is maintained by the database so that every insert/update (including bulk operations) costs a
+# single round trip. The expression must stay identical to the one built by SearchVector('title', weight='A') +
+# SearchVector('description', weight='C') so that both search paths of DebateManager.search return the same results.
+CREATE_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION debate_debate_update_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector(COALESCE(NEW.title, '')), 'A') ||
+        setweight(to_tsvector(COALESCE(NEW.description, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER debate_debate_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, description, search_vector ON debate_debate
+    FOR EACH ROW EXECUTE FUNCTION debate_debate_update_search_vector();
+
+-- Populate the debates that were created through bulk operations before the trigger existed
+UPDATE debate_debate SET search_vector = NULL WHERE search_vector IS NULL;
+"""
+
+DROP_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS debate_debate_search_vector_trigger ON debate_debate;
+DROP FUNCTION IF EXISTS debate_debate_update_search_vector();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debate', '0006_stance_debate_stan_user_id_46459d_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TRIGGER_SQL, reverse_sql=DROP_TRIGGER_SQL),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debate', '0007_debate_search_vector_trigger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DebateRanking',
+            fields=[
+                ('debate', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='debate.debate')),
+                ('trending_score', models.FloatField(default=0)),
+                ('num_votes', models.IntegerField(default=0)),
+                ('stance_stddev', models.FloatField(null=True)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-trending_score'], name='debate_deba_trendin_d5f998_idx'), models.Index(fields=['-num_votes'], name='debate_deba_num_vot_b96bdd_idx'), models.Index(fields=['stance_stddev'], name='debate_deba_stance__0f1be0_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:42
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.utils.timezone import now
+
+
+def backfill_counters(apps, schema_editor):
+    """Initialize the counters from the existing votes and stances."""
+    Debate = apps.get_model('debate', 'Debate')
+    Stance = apps.get_model('debate', 'Stance')
+    Vote = apps.get_model('voting', 'Vote')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+
+    debates = {}
+
+    def get_debate(debate_id):
+        return debates.setdefault(debate_id, Debate(id=debate_id))
+
+    debate_content_type = ContentType.objects.filter(app_label='debate', model='debate').first()
+    if debate_content_type is not None:
+        vote_counters = Vote.objects.filter(content_type=debate_content_type).values('object_id').annotate(
+            num_votes=Count('id'),
+            score=Sum('vote'),
+            num_trending_votes=Count('id', filter=Q(time_stamp__gte=now() - timedelta(hours=48)))
+        )
+        for row in vote_counters:
+            debate = get_debate(int(row['object_id']))
+            debate.vote_count, debate.vote_score = row['num_votes'], row['score']
+            debate.trending_vote_count = row['num_trending_votes']
+
+    stance_counters = Stance.objects.values('debate_id').annotate(
+        num_for=Count('id', filter=Q(stance=True)),
+        num_against=Count('id', filter=Q(stance=False))
+    )
+    for row in stance_counters:
+        debate = get_debate(row['debate_id'])
+        debate.stance_for_count, debate.stance_against_count = row['num_for'], row['num_against']
+
+    # Only update the debates that still exist (votes are not deleted along with their debate)
+    existing_ids = set(Debate.objects.filter(id__in=debates.keys()).values_list('id', flat=True))
+    Debate.objects.bulk_update(
+        [debate for debate_id, debate in debates.items() if debate_id in existing_ids],
+        ['vote_count', 'vote_score', 'trending_vote_count', 'stance_for_count', 'stance_against_count'],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debate', '0008_debateranking'),
+        ('voting', '0002_alter_vote_object_id'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='debate',
+            name='stance_against_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='debate',
+            name='stance_for_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='debate',
+            name='trending_vote_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='debate',
+            name='vote_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='debate',
+            name='vote_score',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debate', '0009_debate_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedDebate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('debate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_debates', to='debate.debate')),
+                ('related_debate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_from', to='debate.debate')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['debate', '-score'], name='debate_rela_debate__6ad51a_idx')],
+                'unique_together': {('debate', 'related_debate')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debate', '0010_relateddebate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['debate', '-date_added', '-id'], name='debate_comm_debate__1a7d56_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+# The debates that already have related debates were processed, the others are processed by the next partial rebuild
+MARK_COMPUTED_SQL = """
+UPDATE debate_debate SET related_debates_computed_at = NOW()
+WHERE EXISTS (SELECT 1 FROM debate_relateddebate WHERE debate_relateddebate.debate_id = debate_debate.id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debate', '0011_comment_keyset_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='debate',
+            name='related_debates_computed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunSQL(MARK_COMPUTED_SQL, reverse_sql=migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='debate',
+            index=models.Index(condition=models.Q(('related_debates_computed_at__isnull', True)), fields=['id'], name='debate_related_missing_idx'),
+        ),
+    ]
@@ -1,16 +1,94 @@
+import heapq
+import math
+import random
+from collections import defaultdict
+
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericRelation
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.fields import ArrayField
 from django.contrib.postgres.search import SearchVector, SearchVectorField, SearchQuery, SearchRank
-from django.core.paginator import Paginator
-from django.db import models
-from django.db.models import Count, Case, When, Window, Max, Q, OuterRef, Subquery
+from django.db import models, transaction, connection, IntegrityError
+from django.db.models import Count, Case, When, Window, Max, Min, Q, OuterRef, Subquery
 from django.template.defaultfilters import slugify
-from django.db.models import F, Func, Value, StdDev
-from django.db.models.functions import Coalesce, Log, Greatest, Now, Abs, Cast
+from django.db.models import F, Func, Value, Sum
+from django.db.models.functions import Coalesce, Greatest, Now, Abs
 from django.contrib.postgres.indexes import GinIndex
+from django.core.cache import cache
 from voting.models import Vote
+
+from ProjectOpenDebate.common.pagination import paginate_keyset
+from django.utils.timezone import now
 from datetime import timedelta
 
+SLUG_MAX_LENGTH = 100
+RANDOM_SAMPLE_ATTEMPTS = 3
+NUM_RELATED_DEBATES = 10
+RELATED_MAX_LEXEMES_PER_DEBATE = 12  # Only the most distinctive lexemes of a debate are used to find related debates
+RELATED_MAX_LEXEME_FREQUENCY = 500  # Lexemes shared by more debates than this are too common to be meaningful
+RELATED_DOCUMENT_FREQUENCIES_CACHE_KEY = 'debate:related:document_frequencies'  # Set by each full rebuild
+SLUG_ALLOCATION_ATTEMPTS = 5
+SLUG_SUFFIX_MAX_DIGITS = 6  # The slugs of a base are looked up assuming less than a million debates share it
+TRENDING_WINDOW = timedelta(hours=48)
+COUNTER_FIELDS = ['vote_count', 'vote_score', 'trending_vote_count', 'stance_for_count', 'stance_against_count']
+
+
+def next_free_slug(base_slug, taken_slugs):
+    """
+    Returns the first slug of the sequence base_slug, base_slug-1, base_slug-2, ... that is not in taken_slugs.
+    The base slug is truncated if needed so that the suffixed slug still fits in the slug field.
+    """
+    slug, suffix = base_slug, 0
+    while slug in taken_slugs:
+        suffix += 1
+        slug = f"{base_slug[:SLUG_MAX_LENGTH - len(str(suffix)) - 1]}-{suffix}"
+    return slug
+
+
+def get_derived_slugs_filter(base_slug):
+    """
+    Returns the condition selecting the slugs that next_free_slug may derive from the base slug.
+    For long base slugs, the base is truncated before the suffix, so the slugs are matched on the shortest truncated
+    prefix. Both conditions are prefix matches that can use the index of the slug field.
+    """
+    prefix_length = SLUG_MAX_LENGTH - SLUG_SUFFIX_MAX_DIGITS - 1
+    if len(base_slug) <= prefix_length:
+        return Q(slug=base_slug) | Q(slug__startswith=f"{base_slug}-")
+    return Q(slug__startswith=base_slug[:prefix_length])
+
+
+# Trending score of a debate, computed from its vote counters: the ratio of its votes cast in the TRENDING_WINDOW
+# (+1 to avoid a division by zero), multiplied by the log2 of its number of votes to give more weight to debates with
+# more votes
+TRENDING_SCORE_SQL = "trending_vote_count::float8 / (vote_count + 1) * LOG(2.0, vote_count + 1)::float8"
+
+# Sample standard deviation of the stances (1 for "for", 0 for "against") of a debate, computed from its stance counters
+# as sqrt(num_for * num_against / (n * (n - 1))). The lower it is, the more controversial the debate since the stances
+# are evenly distributed. Like the StdDev aggregate, this is NULL if there are less than two stances.
+STANCE_STDDEV_SQL = """CASE WHEN stance_for_count + stance_against_count < 2 THEN NULL ELSE SQRT(
+        stance_for_count::float8 * stance_against_count
+        / ((stance_for_count + stance_against_count)::float8 * (stance_for_count + stance_against_count - 1))
+    ) END"""
+
+# Upsert the rankings of every debate in a single statement, only rewriting the rankings whose scores changed
+REFRESH_RANKINGS_SQL = f"""
+INSERT INTO debate_debateranking (debate_id, trending_score, num_votes, stance_stddev, refreshed_at)
+SELECT
+    id,
+    {TRENDING_SCORE_SQL},
+    vote_count,
+    {STANCE_STDDEV_SQL},
+    NOW()
+FROM debate_debate
+ON CONFLICT (debate_id) DO UPDATE SET
+    trending_score = EXCLUDED.trending_score,
+    num_votes = EXCLUDED.num_votes,
+    stance_stddev = EXCLUDED.stance_stddev,
+    refreshed_at = EXCLUDED.refreshed_at
+WHERE (debate_debateranking.trending_score, debate_debateranking.num_votes, debate_debateranking.stance_stddev)
+    IS DISTINCT FROM (EXCLUDED.trending_score, EXCLUDED.num_votes, EXCLUDED.stance_stddev)
+"""
+
 
 class DebateQuerySet(models.QuerySet):
     def with_stance(self, user):
@@ -28,54 +106,254 @@ class DebateManager(models.Manager):
     def get_queryset(self):
         return DebateQuerySet(self.model, using=self._db)
 
-    def get_popular(self):
-        return self.annotate(num_votes=Count('vote')).order_by('-num_votes')
-
     def get_recent(self):
         return self.order_by('-date')
 
-    def get_trending(self):
+    def get_ranked(self, ranking):
+        """
+        Order the debates using the scores precomputed in DebateRanking instead of aggregating the votes and stances
+        on every request. Debates created since the last refresh of the rankings are not included.
+
+        :param ranking: 'trending', 'popular' or 'controversial'
+        :return: A queryset of debates ordered by the given ranking
+        """
+        ordering = {
+            'trending': F('ranking__trending_score').desc(),
+            'popular': F('ranking__num_votes').desc(),
+            'controversial': F('ranking__stance_stddev').asc(),  # NULLs (no stances) last
+        }[ranking]
+
+        # Inner join on the rankings so that Postgres can walk the ranking index and stop after the first rows
+        return self.filter(ranking__isnull=False).order_by(ordering)
+
+    def get_related(self, debate):
+        """
+        Get the debates related to the given debate, most related first.
+        The relations are precomputed by RelatedDebate.objects.rebuild.
+        """
+        return self.filter(
+            related_from__debate=debate
+        ).annotate(
+            relatedness=F('related_from__score')
+        ).order_by('-relatedness')
+
+    def get_random(self, count, exclude_ids=()):
+        """
+        Get a random sample of debates without sorting the whole table like order_by('?') would.
+
+        Random ids are drawn between the smallest and largest debate id and looked up through the primary key index.
+        Since ids can have gaps (deleted debates), a few rounds are attempted and the sample is completed, if needed,
+        with the debates following a random id.
+
+        :param count: The number of debates to return
+        :param exclude_ids: The ids of the debates that should not be part of the sample
+        :return: A queryset of at most count debates (in no particular order)
         """
-        We will keep it simple for now and order by the ratio of votes between now and the maximum between -48 hours
-        and the debate's creation date. Then, we multiply by the log2 of the number of votes to give more weight to debates
-        with more votes.
+        bounds = self.aggregate(min_id=Min('id'), max_id=Max('id'))
+        if bounds['min_id'] is None:
+            return self.none()
+
+        candidates = self.exclude(id__in=exclude_ids)
+        sampled_ids = set()
+        for _ in range(RANDOM_SAMPLE_ATTEMPTS):
+            num_missing = count - len(sampled_ids)
+            if num_missing <= 0:
+                break
+
+            # Oversample to account for the gaps in the ids
+            random_ids = {random.randint(bounds['min_id'], bounds['max_id']) for _ in range(2 * num_missing)}
+            found_ids = candidates.filter(id__in=random_ids - sampled_ids).values_list('id', flat=True)
+            sampled_ids.update(random.sample(list(found_ids), min(num_missing, len(found_ids))))
+
+        # Complete the sample with the debates following a random id, wrapping around to the start if needed
+        num_missing = count - len(sampled_ids)
+        if num_missing > 0:
+            pivot = random.randint(bounds['min_id'], bounds['max_id'])
+            remaining = candidates.exclude(id__in=sampled_ids).order_by('id')
+            sampled_ids.update(remaining.filter(id__gte=pivot).values_list('id', flat=True)[:num_missing])
+            sampled_ids.update(remaining.filter(id__lt=pivot).values_list('id', flat=True)[:count - len(sampled_ids)])
+
+        return self.filter(id__in=sampled_ids)
+
+    def record_vote(self, debate, user, direction):
         """
-        # Get the maximum between -48 hours and the debate's creation date
-        past_date = Greatest(F('date'), Now() - timedelta(hours=48))
+        Record the vote of the user on the debate (see Vote.objects.record_vote) and incrementally update the vote
+        counters of the debate.
 
-        # Get the number of votes between the past date and now
-        num_votes_since = Count('vote', filter=Q(vote__time_stamp__gte=past_date))
+        Note: trending_vote_count is only incremented here, votes leaving the trending window are accounted for by
+        refresh_trending_vote_counts.
 
-        # Number of votes in total/
-        num_votes_total = Count('vote')
+        :param debate: The debate instance
+        :param user: The user voting
+        :param direction: 1 for an upvote, -1 for a downvote and 0 to remove the vote
+        :return: The debate instance with up-to-date counters
+        """
+        with transaction.atomic():
+            # Lock the debate before reading the previous vote, so that concurrent votes of the same user (e.g. a double
+            # click) are serialized and see each other's vote. The row is locked by the counter update below anyway.
+            self.select_for_update().only('id').get(pk=debate.pk)
+
+            previous_vote = Vote.objects.get_for_user(debate, user)
+            Vote.objects.record_vote(debate, user, direction)
+
+            previous_direction = previous_vote.vote if previous_vote else 0
+            vote_count_delta = (direction != 0) - (previous_direction != 0)
+
+            # A vote that changes direction keeps its time stamp, so only created and deleted votes change the
+            # number of votes in the trending window
+            trending_vote_count_delta = 0
+            if vote_count_delta > 0:
+                trending_vote_count_delta = 1
+            elif vote_count_delta < 0 and previous_vote.time_stamp >= max(debate.date, now() - TRENDING_WINDOW):
+                trending_vote_count_delta = -1
+
+            self.filter(pk=debate.pk).update(
+                vote_count=F('vote_count') + vote_count_delta,
+                vote_score=F('vote_score') + direction - previous_direction,
+                trending_vote_count=F('trending_vote_count') + trending_vote_count_delta
+            )
 
-        # Calculate the percentage of votes in the period (+1 to avoid division by zero)
-        percentage_votes_in_period = num_votes_since / (num_votes_total + 1)
+        debate.refresh_from_db(fields=['vote_count', 'vote_score', 'trending_vote_count'])
+        return debate
 
-        # Multiply by the log2 of the number of votes (+1 to avoid log(0))
-        score = percentage_votes_in_period * Log(2, num_votes_total + 1)
+    def refresh_trending_vote_counts(self):
+        """
+        Recompute trending_vote_count for the debates that have (or had) votes in the trending window.
+        Only the recent votes are scanned, so this is cheap enough to run before every ranking refresh.
 
-        return self.annotate(num_votes=num_votes_total).annotate(score=score).order_by('-score')
+        :return: The number of debates whose trending_vote_count changed
+        """
+        recent_vote_counts = {
+            int(object_id): num_votes
+            for object_id, num_votes in Vote.objects.filter(
+                content_type=ContentType.objects.get_for_model(self.model),
+                time_stamp__gte=now() - TRENDING_WINDOW
+            ).values('object_id').annotate(num_votes=Count('id')).values_list('object_id', 'num_votes')
+        }
+
+        changed_debates = []
+        for debate in self.filter(
+                Q(trending_vote_count__gt=0) | Q(id__in=recent_vote_counts.keys())
+        ).only('id', 'trending_vote_count'):
+            trending_vote_count = recent_vote_counts.get(debate.id, 0)
+            if debate.trending_vote_count != trending_vote_count:
+                debate.trending_vote_count = trending_vote_count
+                changed_debates.append(debate)
+
+        self.bulk_update(changed_debates, ['trending_vote_count'], batch_size=1000)
+
+        return len(changed_debates)
+
+    def rebuild_counters(self, dry_run=False):
+        """
+        Recompute the vote and stance counters of every debate from scratch using the Vote and Stance tables.
+
+        :param dry_run: If True, the drift is only reported and the counters are not updated
+        :return: A dict mapping the id of each debate whose counters drifted to {field: (stored, actual)}
+        """
+        trending_since = Greatest(F('date'), Now() - TRENDING_WINDOW)
+
+        # The votes and stances are aggregated separately to avoid multiplying the joined rows
+        actual_vote_counters = {
+            debate_id: counters for debate_id, *counters in self.annotate(
+                actual_vote_count=Count('vote'),
+                actual_vote_score=Coalesce(Sum('vote__vote'), 0),
+                actual_trending_vote_count=Count('vote', filter=Q(vote__time_stamp__gte=trending_since)),
+            ).values_list('id', 'actual_vote_count', 'actual_vote_score', 'actual_trending_vote_count')
+        }
+        actual_stance_counters = {
+            debate_id: counters for debate_id, *counters in self.annotate(
+                actual_stance_for_count=Count('stance', filter=Q(stance__stance=True)),
+                actual_stance_against_count=Count('stance', filter=Q(stance__stance=False)),
+            ).values_list('id', 'actual_stance_for_count', 'actual_stance_against_count')
+        }
+
+        drift = {}
+        drifted_debates = []
+        for debate in self.only('id', *COUNTER_FIELDS):
+            actual_counters = actual_vote_counters[debate.id] + actual_stance_counters[debate.id]
+
+            debate_drift = {}
+            for field, actual in zip(COUNTER_FIELDS, actual_counters):
+                stored = getattr(debate, field)
+                if stored != actual:
+                    debate_drift[field] = (stored, actual)
+                    setattr(debate, field, actual)
+
+            if debate_drift:
+                drift[debate.id] = debate_drift
+                drifted_debates.append(debate)
+
+        if not dry_run:
+            self.bulk_update(drifted_debates, COUNTER_FIELDS, batch_size=1000)
+
+        return drift
+
+    def allocate_slug(self, title):
+        """
+        Returns a slug for the title that is not used by any debate yet.
+        This uses a single indexed prefix query to find the slugs already taken.
 
-    def get_controversial(self):
+        Note: the slug is not reserved, a concurrent insert could still take it. Debate.save handles this by retrying
+        under an advisory lock.
         """
-        To determine the controversy of a debate, we will calculate the standard deviation of the stances.
-        The lower the standard deviation, the more controversial the debate is since it means that the stances are
-        more evenly distributed.
+        base_slug = slugify(title)
+        taken_slugs = set(self.filter(get_derived_slugs_filter(base_slug)).values_list('slug', flat=True))
+        return next_free_slug(base_slug, taken_slugs)
+
+    def allocate_slugs(self, titles):
         """
-        stddev = StdDev(Cast('stance__stance', models.IntegerField()))
+        Batch variant of allocate_slug for bulk imports. The slugs of all the titles are allocated using a single query
+        and are also unique among themselves.
 
-        return self.annotate(stance_stddev=stddev).order_by('stance_stddev')
+        Note: the slugs are not reserved, use bulk_create(ignore_conflicts=True) to skip debates whose slug was taken by
+        a concurrent insert.
 
-    def get_random(self):
-        return self.order_by('?')
+        :param titles: The titles of the debates to create
+        :return: A list of slugs in the same order as titles
+        """
+        base_slugs = [slugify(title) for title in titles]
+
+        # Only look up the slugs derived from the bases of the batch, with indexed prefix matches
+        derived_slugs_filter = Q()
+        for base_slug in set(base_slugs):
+            derived_slugs_filter |= get_derived_slugs_filter(base_slug)
+        taken_slugs = set(self.filter(derived_slugs_filter).values_list('slug', flat=True))
+
+        slugs = []
+        for base_slug in base_slugs:
+            slug = next_free_slug(base_slug, taken_slugs)
+            taken_slugs.add(slug)
+            slugs.append(slug)
+
+        return slugs
+
+    def search(self, query: str, use_search_vector=True):
+        """
+        Search the debates matching the query, ordered by relevance.
+
+        By default, the debates are filtered on the stored search_vector column using the @@ operator. This allows
+        Postgres to use the GIN index (search_vector_idx) and to only rank the matching candidates instead of building
+        a tsvector for every debate in the table.
+
+        :param query: The search query entered by the user
+        :param use_search_vector: If False, the search vector is rebuilt from the title and description of every
+            debate at query time (previous behaviour, kept for benchmarking purposes)
+        :return: A queryset of debates annotated with their rank
+        """
+        search_query = SearchQuery(query)
+
+        if use_search_vector:
+            return self.filter(
+                search_vector=search_query  # search_vector @@ search_query, served by the GIN index
+            ).annotate(
+                rank=SearchRank(F('search_vector'), search_query)
+            ).filter(rank__gt=0.1).order_by('-rank')
 
-    def search(self, query: str):
         search_vector = (
                 SearchVector('title', weight='A') +
                 SearchVector('description', weight='C')
         )
-        search_query = SearchQuery(query)
 
         return self.annotate(
             rank=SearchRank(search_vector, search_query)
@@ -87,18 +365,32 @@ class Debate(models.Model):
     description = models.TextField()
     date = models.DateTimeField(auto_now_add=True)
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
-    slug = models.SlugField(max_length=100,
-                            unique=True)  # WARNING: not generated automatically if using bulk operations
+    # WARNING: not generated automatically if using bulk operations (see allocate_slugs)
+    slug = models.SlugField(max_length=SLUG_MAX_LENGTH, unique=True)
     vote = GenericRelation(Vote, related_query_name='debate')
     search_vector = SearchVectorField(null=True,
-                                      editable=False)  # WARNING: not generated automatically if using bulk operations
+                                      editable=False)  # Maintained by a database trigger, even for bulk operations
+
+    # Denormalized counters maintained by DebateManager.record_vote and Debate.set_stance
+    # They can be rebuilt from scratch with `python manage.py reconcile_debate_counters`
+    vote_count = models.IntegerField(default=0, editable=False)
+    vote_score = models.IntegerField(default=0, editable=False)
+    trending_vote_count = models.IntegerField(default=0, editable=False)  # votes in the last TRENDING_WINDOW
+    stance_for_count = models.IntegerField(default=0, editable=False)
+    stance_against_count = models.IntegerField(default=0, editable=False)
+
+    # When the related debates were last computed by RelatedDebateManager.rebuild, even if none were found
+    related_debates_computed_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     objects = DebateManager()
 
     class Meta:
         indexes = [
             # Gin index for full-text search
-            GinIndex(fields=['search_vector'], name='search_vector_idx')
+            GinIndex(fields=['search_vector'], name='search_vector_idx'),
+            # To quickly get the debates whose related debates were never computed
+            models.Index(fields=['id'], condition=Q(related_debates_computed_at__isnull=True),
+                         name='debate_related_missing_idx'),
         ]
 
     def get_stance(self, user):
@@ -107,76 +399,312 @@ class Debate(models.Model):
         except Stance.DoesNotExist:
             return None
 
-    def save(self, should_update_search_vector=True, *args, **kwargs):
-        is_new = not self.id
+    def set_stance(self, user, stance):
+        """
+        Set the stance of the user on the debate and incrementally update the stance counters of the debate.
+
+        :param user: The user taking a stance
+        :param stance: True for "for", False for "against" or None to remove the stance
+        """
+        with transaction.atomic():
+            # Lock the debate before reading the previous stance, like in DebateManager.record_vote, so that concurrent
+            # calls for the same user are serialized even when there is no stance to lock yet
+            Debate.objects.select_for_update().only('id').get(pk=self.pk)
+
+            previous_stance_instance = self.stance_set.filter(user=user).first()
+            previous_stance = previous_stance_instance.stance if previous_stance_instance else None
+
+            if stance is None:
+                if previous_stance_instance:
+                    previous_stance_instance.delete()
+            elif previous_stance_instance is None:
+                self.stance_set.create(user=user, stance=stance)
+            elif previous_stance != stance:
+                previous_stance_instance.stance = stance
+                previous_stance_instance.save(update_fields=['stance'])
+
+            stance_for_count_delta = (stance is True) - (previous_stance is True)
+            stance_against_count_delta = (stance is False) - (previous_stance is False)
+            if stance_for_count_delta or stance_against_count_delta:
+                Debate.objects.filter(pk=self.pk).update(
+                    stance_for_count=F('stance_for_count') + stance_for_count_delta,
+                    stance_against_count=F('stance_against_count') + stance_against_count_delta
+                )
+
+    def save(self, *args, **kwargs):
+        # Note: the search vector is computed by a database trigger (see migration 0007) on insert and update
+        if self.id:
+            super(Debate, self).save(*args, **kwargs)
+            return
 
         # If the debate is new, generate a slug
-        if is_new:
-            self.slug = slugify(self.title)
+        # We optimistically try the plain slug first since it is almost always free. If another debate already uses it
+        # (or takes it concurrently), we allocate the next free suffix and try again a bounded number of times.
+        base_slug = slugify(self.title)
+        self.slug = base_slug
+        for attempt in range(SLUG_ALLOCATION_ATTEMPTS):
+            try:
+                # The savepoint allows us to retry the insert if we are already inside a transaction
+                with transaction.atomic():
+                    if attempt > 0:
+                        # Serialize the allocation of suffixes for this base slug so that concurrent writers cannot
+                        # pick the same one. The lock is released when the transaction ends.
+                        with connection.cursor() as cursor:
+                            cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [base_slug])
+                        self.slug = Debate.objects.allocate_slug(self.title)
+
+                    super(Debate, self).save(*args, **kwargs)
+                return
+            except IntegrityError:
+                # If the slug is not the cause of the conflict (e.g. duplicate title), there is no point in retrying
+                if not Debate.objects.filter(slug=self.slug).exists():
+                    raise
+
+        raise IntegrityError(f"Could not allocate a unique slug for \"{self.title}\"")
 
-            # get the count of debates with the same slug
-            count = Debate.objects.filter(slug=self.slug).count()
+    def __str__(self):
+        return f"\"{self.title}\" by {self.author}"
 
-            # If there are debates with the same slug, append a number to the slug
-            if count > 0:
-                self.slug = f"{self.slug}-{count}"
 
-        if not should_update_search_vector:
-            super(Debate, self).save(*args, **kwargs)
-            return
+class DebateRankingManager(models.Manager):
+    def refresh(self):
+        """
+        Recompute the trending, popular and controversial scores of every debate from its counters and store them.
+        The scores are computed and upserted by the database in a single INSERT ... SELECT, see REFRESH_RANKINGS_SQL.
 
-        # If the want to update the search vector, we need to ensure that we are updating the search vector not inserting
-        if should_update_search_vector:
-            if is_new:
-                super(Debate, self).save(*args, **kwargs)
+        :return: The number of debates whose ranking was created or changed
+        """
+        # Bring the trending window up to date, the other counters are maintained incrementally
+        Debate.objects.refresh_trending_vote_counts()
 
-                # Update the search vector
-                # This need to be done in update, not insert, because the search vector is a computed field
-                self.search_vector = (
-                        SearchVector('title', weight='A') +
-                        SearchVector('description', weight='C')
-                )
+        with connection.cursor() as cursor:
+            cursor.execute(REFRESH_RANKINGS_SQL)
+            return cursor.rowcount
+
+
+class DebateRanking(models.Model):
+    """
+    Precomputed scores used to order the sections of the explore page.
+    They are refreshed periodically by the debate.tasks.refresh_debate_rankings task.
+    """
+    debate = models.OneToOneField(Debate, on_delete=models.CASCADE, primary_key=True, related_name='ranking')
+    trending_score = models.FloatField(default=0)
+    num_votes = models.IntegerField(default=0)
+    stance_stddev = models.FloatField(null=True)  # null if the debate has less than two stances
+    refreshed_at = models.DateTimeField(auto_now=True)  # when the scores last changed
+
+    objects = DebateRankingManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-trending_score']),
+            models.Index(fields=['-num_votes']),
+            models.Index(fields=['stance_stddev']),
+        ]
+
+    def __str__(self):
+        return f"Ranking of debate {self.debate_id}"
+
+
+class RelatedDebateManager(models.Manager):
+    @staticmethod
+    def get_lexemes(debates):
+        """
+        Get the lexemes of the search vector of each debate.
+
+        :param debates: A queryset of debates
+        :return: A dict mapping the id of each debate to its list of lexemes
+        """
+        return {
+            debate_id: lexemes or []
+            for debate_id, lexemes in debates.annotate(
+                lexemes=Func(F('search_vector'), function='tsvector_to_array',
+                             output_field=ArrayField(models.TextField()))
+            ).values_list('id', 'lexemes')
+        }
+
+    @staticmethod
+    def get_distinctive_lexemes(lexemes, idf):
+        """
+        Get the RELATED_MAX_LEXEMES_PER_DEBATE lexemes of a debate with the highest inverse document frequency.
+
+        :param lexemes: The lexemes of the debate
+        :param idf: A dict mapping the lexemes that can relate debates to their inverse document frequency
+        """
+        return heapq.nlargest(
+            RELATED_MAX_LEXEMES_PER_DEBATE,
+            (lexeme for lexeme in lexemes if lexeme in idf),
+            key=idf.get
+        )
+
+    def get_related_scores(self, debate_id, lexemes, postings, idf, num_related):
+        """
+        Score the debates sharing the most distinctive lexemes of the debate.
+
+        :param debate_id: The id of the debate
+        :param lexemes: The lexemes of the debate
+        :param postings: A dict mapping lexemes to the ids of the debates containing them
+        :param idf: A dict mapping the lexemes that can relate debates to their inverse document frequency
+        :param num_related: The number of related debates to return
+        :return: A list of (related debate id, score) tuples, the most related first
+        """
+        scores = defaultdict(float)
+        for lexeme in self.get_distinctive_lexemes(lexemes, idf):
+            for other_debate_id in postings.get(lexeme, []):
+                scores[other_debate_id] += idf[lexeme]
+        scores.pop(debate_id, None)
+
+        return heapq.nlargest(num_related, scores.items(), key=lambda item: item[1])
+
+    def rebuild(self, debate_ids=None, num_related=NUM_RELATED_DEBATES):
+        """
+        Compute the related debates of the given debates (or of every debate) and replace the existing relations.
 
-                self.save(should_update_search_vector=False)
-            else:
-                # If the debate is not new and we want to update the search vector
-                self.search_vector = (
-                        SearchVector('title', weight='A') +
-                        SearchVector('description', weight='C')
+        Two debates are related if they share lexemes in their search vector. Each shared lexeme contributes its inverse
+        document frequency to the score, so that rare words weigh more than common ones. Lexemes that are too common
+        are ignored and only the most distinctive lexemes of each debate are considered to bound the amount of work.
+
+        A full rebuild reads the lexemes of every debate and caches their document frequencies. A partial rebuild reuses
+        these frequencies and only reads the debates sharing a distinctive lexeme with the given debates, found with the
+        search_vector_idx index. If the frequencies are not cached, a full rebuild is made instead.
+
+        :param debate_ids: The ids of the debates whose relations should be rebuilt, or None for every debate
+        :param num_related: The number of related debates to store per debate
+        :return: The number of debates whose relations were rebuilt
+        """
+        if debate_ids is None:
+            lexemes_per_debate = self.get_lexemes(Debate.objects.all())
+            target_lexemes = lexemes_per_debate
+
+            # Build the inverted index of the lexemes
+            postings = defaultdict(list)
+            for debate_id, lexemes in lexemes_per_debate.items():
+                for lexeme in lexemes:
+                    postings[lexeme].append(debate_id)
+
+            num_debates = len(lexemes_per_debate)
+            document_frequencies = {
+                lexeme: len(debate_ids_with_lexeme) for lexeme, debate_ids_with_lexeme in postings.items()
+            }
+            cache.set(RELATED_DOCUMENT_FREQUENCIES_CACHE_KEY, (num_debates, document_frequencies), timeout=None)
+
+            idf = {
+                lexeme: math.log(num_debates / document_frequency)
+                for lexeme, document_frequency in document_frequencies.items()
+                if 1 < document_frequency <= RELATED_MAX_LEXEME_FREQUENCY
+            }
+        else:
+            cached_frequencies = cache.get(RELATED_DOCUMENT_FREQUENCIES_CACHE_KEY)
+            if cached_frequencies is None:
+                return self.rebuild(num_related=num_related)
+
+            num_debates, document_frequencies = cached_frequencies
+            target_lexemes = self.get_lexemes(Debate.objects.filter(id__in=debate_ids))
+
+            # The lexemes unknown to the last full rebuild (e.g. from new debates) are only in the debate itself so far.
+            # Unlike in a full rebuild, they are kept since they may be shared with another new debate.
+            idf = {}
+            for lexemes in target_lexemes.values():
+                for lexeme in lexemes:
+                    document_frequency = document_frequencies.get(lexeme, 1)
+                    if document_frequency <= RELATED_MAX_LEXEME_FREQUENCY:
+                        idf[lexeme] = math.log(max(num_debates, 1) / document_frequency)
+
+            query_lexemes = set()
+            for lexemes in target_lexemes.values():
+                query_lexemes.update(self.get_distinctive_lexemes(lexemes, idf))
+
+            # Only the debates sharing one of these lexemes can be related, the index finds them without a scan
+            postings = defaultdict(list)
+            if query_lexemes:
+                lexemes_query = ' | '.join(
+                    "'{}'".format(lexeme.replace('\\', '\\\\').replace("'", "''")) for lexeme in query_lexemes
                 )
+                candidates = Debate.objects.filter(
+                    search_vector=SearchQuery(lexemes_query, config='simple', search_type='raw')
+                )
+                for debate_id, lexemes in self.get_lexemes(candidates).items():
+                    for lexeme in lexemes:
+                        if lexeme in query_lexemes:
+                            postings[lexeme].append(debate_id)
+
+        related_debates = [
+            RelatedDebate(debate_id=debate_id, related_debate_id=related_debate_id, score=score)
+            for debate_id, lexemes in target_lexemes.items()
+            for related_debate_id, score in self.get_related_scores(debate_id, lexemes, postings, idf, num_related)
+        ]
+
+        with transaction.atomic():
+            stale_relations = self.all() if debate_ids is None else self.filter(debate_id__in=target_lexemes.keys())
+            stale_relations.delete()
+            self.bulk_create(related_debates, batch_size=1000)
+
+            # Mark the debates as processed, even those without any related debate
+            Debate.objects.filter(id__in=target_lexemes.keys()).update(related_debates_computed_at=now())
+
+        return len(target_lexemes)
+
+    def rebuild_missing(self, num_related=NUM_RELATED_DEBATES):
+        """
+        Compute the related debates of the debates that were never processed (e.g. newly created debates).
+        """
+        missing_ids = list(Debate.objects.filter(related_debates_computed_at__isnull=True).values_list('id', flat=True))
+        if not missing_ids:
+            return 0
+
+        return self.rebuild(debate_ids=missing_ids, num_related=num_related)
 
-                super(Debate, self).save(*args, **kwargs)
+
+class RelatedDebate(models.Model):
+    """
+    Precomputed relation between two debates used to suggest debates on the debate page.
+    See RelatedDebateManager.rebuild for how the relations are computed.
+    """
+    debate = models.ForeignKey(Debate, on_delete=models.CASCADE, related_name='related_debates')
+    related_debate = models.ForeignKey(Debate, on_delete=models.CASCADE, related_name='related_from')
+    score = models.FloatField()
+
+    objects = RelatedDebateManager()
+
+    class Meta:
+        unique_together = ('debate', 'related_debate')
+        indexes = [
+            # To quickly get the most related debates of a debate
+            models.Index(fields=['debate', '-score']),
+        ]
 
     def __str__(self):
-        return f"\"{self.title}\" by {self.author}"
+        return f"Debate {self.related_debate_id} related to debate {self.debate_id}"
 
 
 class CommentManager(models.Manager):
-    def get_debate_comments_page(self, user, debate, page=1, page_size=10):
+    def get_debate_comments_page(self, user, debate, cursor=None, page_size=10):
         """
-        Get all comments for a debate ordered by date added
-        It also annotates the comments with the user's vote and the number of votes
+        Get a page of comments for a debate ordered by date added, newest first
+        It also annotates the comments of the page with the user's vote and the number of votes
+
+        Note: we use keyset pagination so that the cost of a page does not depend on the number of comments
 
         :param user: The user instance
         :param debate: The debate instance
-        :param page: The page number
+        :param cursor: The cursor of the page, as given by the next_cursor of the previous page, or None for the first
+            page
         :param page_size: The number of comments per page
-        :return: A queryset of comments
+        :return: A KeysetPage of comments
         """
-        comments = self.filter(debate=debate).order_by('-date_added').select_related('author')
+        comments = self.filter(debate=debate).select_related('author')
 
         # Get the page of comments
-        paginator = Paginator(comments, page_size)
-        comments_page = paginator.get_page(page)
+        comments_page = paginate_keyset(comments, ('-date_added', '-id'), cursor=cursor, page_size=page_size)
 
-        # Get votes for the comments
-        comment_votes = Vote.objects.get_for_user_in_bulk(comments_page, user)
+        # Get votes for the comments of the page
+        comment_votes = Vote.objects.get_for_user_in_bulk(comments_page.object_list, user)
 
-        # Get the number of votes for each comment
-        comment_vote_scores = Vote.objects.get_scores_in_bulk(comments)
+        # Get the number of votes for each comment of the page
+        comment_vote_scores = Vote.objects.get_scores_in_bulk(comments_page.object_list)
 
         # Annotate the comments with the vote information
-        for comment in comments:
+        for comment in comments_page:
             key = str(comment.id)
             comment.user_vote = comment_votes.get(key)
             comment.vote_score, comment.num_votes = comment_vote_scores.get(key, {'score': 0, 'num_votes': 0}).values()
@@ -193,6 +721,12 @@ class Comment(models.Model):
 
     objects = CommentManager()
 
+    class Meta:
+        indexes = [
+            # To paginate the comments of a debate, see CommentManager.get_debate_comments_page
+            models.Index(fields=['debate', '-date_added', '-id']),
+        ]
+
     def __str__(self):
         return f"Comment by {self.author} on \"{self.debate.title}\""
 
@@ -0,0 +1,34 @@
+from celery import shared_task
+from celery.utils.log import get_task_logger
+
+from .models import DebateRanking, RelatedDebate
+
+logger = get_task_logger(__name__)
+
+
+@shared_task
+def refresh_debate_rankings():
+    """
+    Recomputes the scores used by the explore page sections (trending, popular and controversial).
+    """
+    logger.info('Refreshing debate rankings')
+
+    num_changed = DebateRanking.objects.refresh()
+
+    logger.info(f'Refreshed the rankings, {num_changed} of them changed')
+
+
+@shared_task
+def refresh_related_debates(only_missing=True):
+    """
+    Computes the related debates suggested on the debate page.
+    By default, only the debates whose related debates were never computed (e.g. new debates) are processed.
+    """
+    logger.info('Refreshing related debates')
+
+    if only_missing:
+        num_debates = RelatedDebate.objects.rebuild_missing()
+    else:
+        num_debates = RelatedDebate.objects.rebuild()
+
+    logger.info(f'Refreshed the related debates of {num_debates} debates')
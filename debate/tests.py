@@ -1,3 +1,173 @@
-from django.test import TestCase
+import math
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from ProjectOpenDebate.common.pagination import decode_cursor, encode_cursor, paginate_keyset
+from .models import Comment, Debate, DebateRanking, SLUG_MAX_LENGTH, Stance
+
+
+class KeysetCursorTests(SimpleTestCase):
+    def test_cursor_keeps_microseconds(self):
+        value = datetime(2024, 1, 1, 12, 0, 0, 123456, tzinfo=timezone.utc)
+
+        values = decode_cursor(encode_cursor([value, 1]), 2)
+
+        self.assertEqual(datetime.fromisoformat(values[0]), value)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='author', password='password')
+        self.debate = Debate.objects.create(title='Keyset pagination', description='Test')
+
+    def test_rows_in_same_millisecond_are_not_skipped(self):
+        older = Comment.objects.create(debate=self.debate, author=self.user, text='Older')
+        newer = Comment.objects.create(debate=self.debate, author=self.user, text='Newer')
+        older_date = datetime(2024, 1, 1, 12, 0, 0, 123100, tzinfo=timezone.utc)
+        Comment.objects.filter(id=older.id).update(date_added=older_date)
+        newer_date = datetime(2024, 1, 1, 12, 0, 0, 123900, tzinfo=timezone.utc)
+        Comment.objects.filter(id=newer.id).update(date_added=newer_date)
+        comments = Comment.objects.filter(debate=self.debate)
+        ordering = ('-date_added', '-id')
+
+        first_page = paginate_keyset(comments, ordering, page_size=1)
+        second_page = paginate_keyset(comments, ordering, cursor=first_page.next_cursor, page_size=1)
+
+        self.assertEqual([comment.id for comment in first_page], [newer.id])
+        self.assertTrue(first_page.has_next)
+        self.assertEqual([comment.id for comment in second_page], [older.id])
+        self.assertFalse(second_page.has_next)
+
+
+class DebateCounterTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='voter', password='password')
+        self.debate = Debate.objects.create(title='Counters', description='Test')
+
+    def assertCounters(self, **counters):
+        self.debate.refresh_from_db(fields=list(counters))
+        self.assertEqual({field: getattr(self.debate, field) for field in counters}, counters)
+
+    def test_set_stance_updates_stance_counters(self):
+        self.debate.set_stance(self.user, True)
+        self.assertCounters(stance_for_count=1, stance_against_count=0)
+
+        self.debate.set_stance(self.user, True)
+        self.assertCounters(stance_for_count=1, stance_against_count=0)
+
+        self.debate.set_stance(self.user, False)
+        self.assertCounters(stance_for_count=0, stance_against_count=1)
+
+        self.debate.set_stance(self.user, None)
+        self.assertCounters(stance_for_count=0, stance_against_count=0)
+        self.assertFalse(Stance.objects.filter(debate=self.debate, user=self.user).exists())
+
+    def test_record_vote_updates_vote_counters(self):
+        Debate.objects.record_vote(self.debate, self.user, 1)
+        self.assertCounters(vote_count=1, vote_score=1, trending_vote_count=1)
+
+        Debate.objects.record_vote(self.debate, self.user, -1)
+        self.assertCounters(vote_count=1, vote_score=-1, trending_vote_count=1)
+
+        Debate.objects.record_vote(self.debate, self.user, 0)
+        self.assertCounters(vote_count=0, vote_score=0, trending_vote_count=0)
+
+    def test_counters_match_a_rebuild(self):
+        other_user = get_user_model().objects.create_user(username='other voter', password='password')
+        self.debate.set_stance(self.user, True)
+        self.debate.set_stance(other_user, False)
+        Debate.objects.record_vote(self.debate, self.user, 1)
+        Debate.objects.record_vote(self.debate, other_user, 1)
+        Debate.objects.record_vote(self.debate, other_user, -1)
+
+        self.assertEqual(Debate.objects.rebuild_counters(dry_run=True), {})
+
+
+class DebateRankingTests(TestCase):
+    def test_refresh_computes_the_scores_from_the_counters(self):
+        debate = Debate.objects.create(title='Rankings', description='Test')
+        quiet_debate = Debate.objects.create(title='Quiet rankings', description='Test')
+        users = [get_user_model().objects.create_user(username=f'ranker {i}', password='password') for i in range(3)]
+        for user, stance in zip(users, [True, True, False]):
+            debate.set_stance(user, stance)
+            Debate.objects.record_vote(debate, user, 1)
+
+        self.assertEqual(DebateRanking.objects.refresh(), 2)
+
+        ranking = DebateRanking.objects.get(debate=debate)
+        self.assertEqual(ranking.num_votes, 3)
+        self.assertAlmostEqual(ranking.trending_score, 3 / 4 * math.log2(4))
+        self.assertAlmostEqual(ranking.stance_stddev, math.sqrt(2 * 1 / (3 * 2)))
+
+        quiet_ranking = DebateRanking.objects.get(debate=quiet_debate)
+        self.assertEqual((quiet_ranking.num_votes, quiet_ranking.trending_score), (0, 0))
+        self.assertIsNone(quiet_ranking.stance_stddev)
+
+        # The unchanged rankings are not rewritten
+        self.assertEqual(DebateRanking.objects.refresh(), 0)
+
+
+class ConcurrentStanceTests(TransactionTestCase):
+    def set_stance(self, debate, user, stance):
+        """Sets the stance from a worker thread, which uses its own database connection."""
+        try:
+            debate.set_stance(user, stance)
+        finally:
+            connection.close()
+
+    def test_concurrent_first_stances_of_a_user(self):
+        user = get_user_model().objects.create_user(username='double click', password='password')
+        debate = Debate.objects.create(title='Concurrent stances', description='Test')
+        num_calls = 4
+
+        with ThreadPoolExecutor(max_workers=num_calls) as executor:
+            list(executor.map(self.set_stance, [debate] * num_calls, [user] * num_calls, [True] * num_calls))
+
+        debate.refresh_from_db(fields=['stance_for_count', 'stance_against_count'])
+        self.assertEqual((debate.stance_for_count, debate.stance_against_count), (1, 0))
+        self.assertEqual(Stance.objects.filter(debate=debate, user=user).count(), 1)
+
+
+class DebateSlugTests(TransactionTestCase):
+    # All these titles are unique but slugify to the same base slug
+    PUNCTUATIONS = ['', '!', '?', '.', ',', ';', ':', '!!', '??', '..', '!?', '?!']
+
+    def create_debate(self, title):
+        """Creates a debate from a worker thread, which uses its own database connection."""
+        try:
+            return Debate.objects.create(title=title, description='Test').slug
+        finally:
+            connection.close()
+
+    def test_concurrent_debates_get_unique_slugs(self):
+        titles = [f'Concurrent slugs{punctuation}' for punctuation in self.PUNCTUATIONS]
+
+        with ThreadPoolExecutor(max_workers=len(titles)) as executor:
+            slugs = list(executor.map(self.create_debate, titles))
+
+        self.assertEqual(len(set(slugs)), len(titles))
+        self.assertEqual(Debate.objects.filter(title__in=titles).count(), len(titles))
+
+    def test_long_slugs_are_truncated_before_the_suffix(self):
+        base_title = 'a' * (SLUG_MAX_LENGTH - 1)
+        titles = [f'{base_title}{punctuation}' for punctuation in self.PUNCTUATIONS if len(punctuation) <= 1]
+
+        slugs = [Debate.objects.create(title=title, description='Test').slug for title in titles]
+
+        self.assertEqual(len(set(slugs)), len(titles))
+        self.assertTrue(all(len(slug) <= SLUG_MAX_LENGTH for slug in slugs))
+
+    def test_allocate_slugs_skips_truncated_slugs(self):
+        base_title = 'b' * (SLUG_MAX_LENGTH - 1)
+        Debate.objects.create(title=base_title, description='Test')
+        Debate.objects.create(title=f'{base_title}!', description='Test')
+
+        slugs = Debate.objects.allocate_slugs([f'{base_title}?', f'{base_title}.'])
+
+        taken_slugs = set(Debate.objects.values_list('slug', flat=True))
+        self.assertEqual(len(set(slugs)), 2)
+        self.assertFalse(taken_slugs & set(slugs))
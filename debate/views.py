@@ -23,11 +23,11 @@ logger = logging.getLogger(__name__)
 def explore(request):
     limit = 10
     sections = [
-        ('Trending', Debate.objects.get_trending().with_stance(request.user)[:limit]),
-        ('Popular', Debate.objects.get_popular().with_stance(request.user)[:limit]),
+        ('Trending', Debate.objects.get_ranked('trending').with_stance(request.user)[:limit]),
+        ('Popular', Debate.objects.get_ranked('popular').with_stance(request.user)[:limit]),
         ('Recent', Debate.objects.get_recent().with_stance(request.user)[:limit]),
-        ('Controversial', Debate.objects.get_controversial().with_stance(request.user)[:limit]),
-        ('Other', Debate.objects.get_random().with_stance(request.user)[:limit])
+        ('Controversial', Debate.objects.get_ranked('controversial').with_stance(request.user)[:limit]),
+        ('Other', Debate.objects.get_random(limit).with_stance(request.user))
     ]
 
     context = {
@@ -70,8 +70,8 @@ def list_comments(request, debate_slug):
     # Get the debate instance
     debate_instance = get_object_or_404(Debate, slug=debate_slug)
 
-    page = request.GET.get('page', 1)
-    comments = Comment.objects.get_debate_comments_page(request.user, debate_instance, page=page)
+    cursor = request.GET.get('cursor')
+    comments = Comment.objects.get_debate_comments_page(request.user, debate_instance, cursor=cursor)
 
     context = {
         'page': comments,
@@ -99,17 +99,21 @@ def debate(request, debate_slug):
     has_requested_against = user_discussion_requests.filter(stance_wanted=False).exists()
 
     # Get the user's vote on the debate
+    # Note: the score of the debate is already available through the vote_score counter
     debate_vote = Vote.objects.get_for_user(debate_instance, request.user)
 
-    # Get the score for the debate
-    debate_score = Vote.objects.get_score(debate_instance)
-
-    # Annotate the debate with the user's stance, discussion requests and vote
+    # Annotate the debate with the user's vote
     debate_instance.user_vote = debate_vote
-    debate_instance.vote_score, debate_instance.num_votes = debate_score['score'], debate_score['num_votes']
 
     # Get suggestions for the user
-    suggested_debates = Debate.objects.get_random().exclude(id=debate_instance.id).with_stance(request.user)[:10]
+    # We suggest the related debates first and fill the remaining spots with random debates
+    num_suggestions = 10
+    suggested_debates = list(Debate.objects.get_related(debate_instance).with_stance(request.user)[:num_suggestions])
+    if len(suggested_debates) < num_suggestions:
+        exclude_ids = [debate_instance.id] + [suggested_debate.id for suggested_debate in suggested_debates]
+        suggested_debates += Debate.objects.get_random(
+            num_suggestions - len(suggested_debates), exclude_ids=exclude_ids
+        ).with_stance(request.user)
 
     # Define the context to be passed to the template
     context = {
@@ -134,12 +138,9 @@ def set_stance(request, debate_slug):
     if stance not in ['for', 'against', 'unset']:
         return HttpResponseBadRequest()
 
-    # Update the user's stance on the debate
-    if stance == 'unset':
-        debate_instance.stance_set.filter(user=request.user).delete()
-    else:
-        stance_bool = stance == 'for'
-        debate_instance.stance_set.update_or_create(user=request.user, defaults={'stance': stance_bool})
+    # Update the user's stance on the debate (and the stance counters of the debate)
+    stance_bool = None if stance == 'unset' else stance == 'for'
+    debate_instance.set_stance(request.user, stance_bool)
 
     # Delete any pending discussion requests for the user on this debate
     DiscussionRequest.objects.filter(requester=request.user, debate=debate_instance).delete()
@@ -244,15 +245,15 @@ def vote(request, debate_slug):
 
     # Check if the user tries to vote on a comment or the debate itself
     if 'comment_id' in request.POST:
-        instance_to_vote_on = get_object_or_404(debate_instance.comment_set, id=request.POST['comment_id'])
-    else:
-        instance_to_vote_on = debate_instance
+        comment_instance = get_object_or_404(debate_instance.comment_set, id=request.POST['comment_id'])
 
-    # Record the vote
-    Vote.objects.record_vote(instance_to_vote_on, request.user, direction)
-
-    # Get the new score of the instance
-    new_score_dict = Vote.objects.get_score(instance_to_vote_on)
+        # Record the vote and get the new score of the comment
+        Vote.objects.record_vote(comment_instance, request.user, direction)
+        new_score_dict = Vote.objects.get_score(comment_instance)
+    else:
+        # Record the vote, this also updates the vote counters of the debate
+        debate_instance = Debate.objects.record_vote(debate_instance, request.user, direction)
+        new_score_dict = {'score': debate_instance.vote_score, 'num_votes': debate_instance.vote_count}
 
     # Return the new score
     return JsonResponse(new_score_dict)
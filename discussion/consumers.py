@@ -1,8 +1,10 @@
 from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
+from django.db import transaction
 from django.db.models import Q
 from django.template.loader import render_to_string
 
+from ProjectOpenDebate.common.publishing import publish_many, apublish_many
 from ProjectOpenDebate.consumers import CustomBaseConsumer, get_user_group_name
 from .forms import MessageForm
 from .models import Discussion, Message
@@ -62,18 +64,29 @@ class DiscussionConsumer(CustomBaseConsumer):
         if messageForm.is_valid():
             messageForm.instance.discussion_id = discussion.id
             messageForm.instance.author = user
-            message_instance = await database_sync_to_async(messageForm.save)()
+            await self.save_and_publish_message(user, discussion, messageForm)
         else:
             await self.send_json({'status': 'error', 'message': 'Invalid message'})
             return
 
+    @database_sync_to_async
+    @transaction.atomic
+    def save_and_publish_message(self, user, discussion, message_form):
+        """
+        Saves the message and publishes it to the participants.
+        The message, the unread counter increment (see increment_unread_counts), the read checkpoint of the sender and
+        the events are saved atomically, so the participants are notified if and only if the message is saved.
+        """
+        message_instance = message_form.save()
+        message = message_instance.text
+
         # mark this message's discussion's read checkpoint as read until this message
-        user_readcheckpoint = await discussion.readcheckpoint_set.aget(user=user)
-        await database_sync_to_async(user_readcheckpoint.read_until)(message_instance)
+        user_readcheckpoint = discussion.readcheckpoint_set.get(user=user)
+        user_readcheckpoint.read_until(message_instance)
 
         # Set additional fields for the message
         # TODO: This is a bit hacky, we should find a better way to do this
-        previous_message = await discussion.message_set.order_by('-created_at').exclude(id=message_instance.id).afirst()
+        previous_message = discussion.message_set.order_by('-created_at').exclude(id=message_instance.id).first()
         message_instance.prev_message_created_at = previous_message.created_at if previous_message else None
         set_message_additional_fields(message_instance)
 
@@ -97,11 +110,12 @@ class DiscussionConsumer(CustomBaseConsumer):
         message_receiver_html = render_to_string('discussion/message.html', context=context_receiver)
 
         # Send the message to all participants in the discussion
+        events = []
         participants_ids = [discussion.participant1_id, discussion.participant2_id]
         is_archived_flags = [discussion.is_archived_for_p1, discussion.is_archived_for_p2]
         for participant_id, is_archived in zip(participants_ids, is_archived_flags):
             user_group_name = get_user_group_name(self.__class__.__name__, participant_id)
-            await self.channel_layer.group_send(
+            events.append((
                 user_group_name,
                 {
                     'status': 'success',
@@ -118,7 +132,9 @@ class DiscussionConsumer(CustomBaseConsumer):
                         'is_current_user_sender': participant_id == user.id,
                     }
                 }
-            )
+            ))
+
+        publish_many(events)
 
     async def process_read_messages(self, user, discussion, data):
         # TODO: there could be a bug where the user reads the messages, but the other user sends a message before the
@@ -131,12 +147,13 @@ class DiscussionConsumer(CustomBaseConsumer):
         num_messages_read = await database_sync_to_async(read_checkpoint.read_messages)()
 
         # Send the updated ReadCheckpoint information to BOTH participants
+        events = []
         participants_ids = [discussion.participant1_id, discussion.participant2_id]
         is_archived_flags = [discussion.is_archived_for_p1, discussion.is_archived_for_p2]
         for participant_id, is_archived in zip(participants_ids, is_archived_flags):
             user_group_name = get_user_group_name(self.__class__.__name__, participant_id)
             is_current_user = participant_id == user.id
-            await self.channel_layer.group_send(
+            events.append((
                 user_group_name,
                 {
                     'status': 'success',
@@ -150,6 +167,6 @@ class DiscussionConsumer(CustomBaseConsumer):
                         'through_load_discussion': data['through_load_discussion']
                     }
                 }
-            )
-
+            ))
 
+        await apublish_many(events)
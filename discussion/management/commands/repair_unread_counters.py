@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from discussion.models import ReadCheckpoint
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the unread message counters of every read checkpoint from the messages and reports the drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the drift, do not fix it')
+        parser.add_argument('--verbose-drift', action='store_true', help='Print the drift of every read checkpoint')
+
+    def handle(self, *args, **options):
+        drift = ReadCheckpoint.objects.rebuild_unread_counts(dry_run=options['dry_run'])
+
+        if options['verbose_drift']:
+            for read_checkpoint_id, (stored, actual) in drift.items():
+                self.stdout.write(f'ReadCheckpoint {read_checkpoint_id}: {stored} -> {actual}')
+
+        total_drift = sum(abs(actual - stored) for stored, actual in drift.values())
+        self.stdout.write(f'unread_count: total drift of {total_drift}')
+
+        action = 'would be fixed' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(f'{len(drift)} read checkpoints with drifted counters {action}.'))
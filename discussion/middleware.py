@@ -1,39 +1,17 @@
-from datetime import datetime
-
-from django.db.models import Q, Count, Subquery, Sum, OuterRef
-from django.db.models.functions import Coalesce
-
-from discussion.models import ReadCheckpoint, Discussion
+from ProjectOpenDebate.common.badges import set_lazy_badge
+from discussion.models import ReadCheckpoint
 
 
 class MessageMiddleware:
-    """Adds num_unread_messages to the request, user object."""
+    """Adds num_unread_messages to the request, user object. The value is only computed if it is used."""
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
         if request.user.is_authenticated:
-            # Subquery to get the latest read message timestamp for each discussion
-            last_read_timestamp = ReadCheckpoint.objects.filter(
-                user=request.user,
-                discussion=OuterRef('pk')
-            ).values('last_message_read__created_at')[:1]
-
-            # Query to get the count of messages that are after the checkpoint for each discussion
-            unread_messages_query = (
-                Discussion.objects
-                .filter((Q(participant1=request.user) & Q(is_archived_for_p1=False)) |
-                        (Q(participant2=request.user) & Q(is_archived_for_p2=False)))
-                .annotate(
-                    unread_count=Count(
-                        'message',
-                        filter=Q(message__created_at__gt=Coalesce(Subquery(last_read_timestamp), datetime.min))
-                    )
-                )
-            )
-
-            # Get the total number of unread messages
-            request.user.num_unread_messages = unread_messages_query.aggregate(Sum('unread_count'))['unread_count__sum']
+            # Get the total number of unread messages from the unread counters of the user
+            user = request.user
+            set_lazy_badge(request, 'num_unread_messages', lambda: ReadCheckpoint.objects.get_num_unread_messages(user))
 
         response = self.get_response(request)
 
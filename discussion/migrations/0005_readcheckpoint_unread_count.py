@@ -0,0 +1,48 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:47
+
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread_counts(apps, schema_editor):
+    """Initialize the unread counters from the existing messages and checkpoints."""
+    ReadCheckpoint = apps.get_model('discussion', 'ReadCheckpoint')
+    Message = apps.get_model('discussion', 'Message')
+
+    unread_messages = Message.objects.filter(
+        discussion=OuterRef('discussion'),
+        created_at__gt=Coalesce(OuterRef('last_message_read__created_at'), datetime.min.replace(tzinfo=timezone.utc))
+    ).order_by().values('discussion').annotate(count=Count('id')).values('count')
+
+    read_checkpoints = list(
+        ReadCheckpoint.objects.annotate(actual_unread_count=Coalesce(Subquery(unread_messages), 0)).only('id')
+    )
+    for read_checkpoint in read_checkpoints:
+        read_checkpoint.unread_count = read_checkpoint.actual_unread_count
+
+    ReadCheckpoint.objects.bulk_update(read_checkpoints, ['unread_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussion', '0004_discussion_is_archived_for_p1_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='readcheckpoint',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_unread_counts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='readcheckpoint',
+            index=models.Index(condition=models.Q(('unread_count__gt', 0)), fields=['user'], include=('unread_count',), name='readcheckpoint_unread_idx'),
+        ),
+    ]
@@ -1,15 +1,15 @@
-from datetime import datetime
+from datetime import datetime, timezone
 
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
 from django.db.models.functions import Coalesce
 from django.dispatch import receiver
 from django.template.loader import render_to_string
 
+from ProjectOpenDebate.common.publishing import publish_many
 from ProjectOpenDebate.consumers import get_user_group_name
 from debate.models import Debate
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 from django.db.models.signals import post_save
 
 from discussion.deletion import SET_WITH
@@ -51,15 +51,23 @@ class Discussion(models.Model):
         ReadCheckpoint.objects.create(discussion=self, user=self.participant2)
 
     def add_discussion_to_participants_list_live(self, as_unread=True):
-        # Get current channel layer
-        channel_layer = get_channel_layer()
+        """
+        Send the discussion to the participants so that it is added to their list of discussions.
+        Note: if called inside a transaction, the discussion is only sent once the transaction is committed.
+        """
+        publish_many(self.get_new_discussion_events(as_unread))
 
+    def get_new_discussion_events(self, as_unread=True):
+        """
+        Get the events adding the discussion to the list of discussions of the participants, see publish_many.
+        """
         # Add the is_unread flag to the discussion
         self.is_unread = as_unread
 
         # Render discussion to send to the participants
         discussion_html = render_to_string('discussion/discussion.html', context={'discussion': self})
 
+        events = []
         for participant_id in [self.participant1_id, self.participant2_id]:
             user_group_name = get_user_group_name('DiscussionConsumer', participant_id)
 
@@ -68,7 +76,7 @@ class Discussion(models.Model):
             #   This isn't a big problem, but its not optimal.
             #   We could pass the necessary information as arguments to notify_participants() instead.
             #   However, it would probably make it less readable.
-            async_to_sync(channel_layer.group_send)(
+            events.append((
                 user_group_name,
                 {
                     'status': 'success',
@@ -80,7 +88,9 @@ class Discussion(models.Model):
                         'html': discussion_html,
                     }
                 }
-            )
+            ))
+
+        return events
 
     def is_archived_for(self, user):
         if user == self.participant1:
@@ -120,12 +130,62 @@ class DiscussionRequest(models.Model):
         return f"Request by {self.requester} for debate \"{self.debate.title}\""
 
 
+class ReadCheckpointManager(models.Manager):
+    def get_num_unread_messages(self, user):
+        """
+        Get the total number of unread messages of the user in their non-archived discussions.
+        This is a sum over the unread counters of the user, which only touches the checkpoints with unread messages.
+
+        :param user: The user instance
+        :return: The number of unread messages
+        """
+        return self.filter(
+            (Q(discussion__participant1=user) & Q(discussion__is_archived_for_p1=False)) |
+            (Q(discussion__participant2=user) & Q(discussion__is_archived_for_p2=False)),
+            user=user,
+            unread_count__gt=0,
+        ).aggregate(num_unread_messages=Coalesce(Sum('unread_count'), 0))['num_unread_messages']
+
+    def rebuild_unread_counts(self, dry_run=False):
+        """
+        Recompute the unread counters of every ReadCheckpoint from the messages.
+
+        :param dry_run: If True, the drift is only reported and the counters are not updated
+        :return: A dict mapping the id of each ReadCheckpoint whose counter drifted to (stored, actual)
+        """
+        # The messages created after the last message read (every message if the user has not read any)
+        never_read = datetime.min.replace(tzinfo=timezone.utc)
+        unread_messages = Message.objects.filter(
+            discussion=OuterRef('discussion'),
+            created_at__gt=Coalesce(OuterRef('last_message_read__created_at'), never_read)
+        ).order_by().values('discussion').annotate(count=Count('id')).values('count')
+
+        drift = {}
+        drifted_read_checkpoints = []
+        for read_checkpoint in self.annotate(
+                actual_unread_count=Coalesce(Subquery(unread_messages), 0)
+        ).only('id', 'unread_count'):
+            if read_checkpoint.unread_count != read_checkpoint.actual_unread_count:
+                drift[read_checkpoint.id] = (read_checkpoint.unread_count, read_checkpoint.actual_unread_count)
+                read_checkpoint.unread_count = read_checkpoint.actual_unread_count
+                drifted_read_checkpoints.append(read_checkpoint)
+
+        if not dry_run:
+            self.bulk_update(drifted_read_checkpoints, ['unread_count'], batch_size=1000)
+
+        return drift
+
+
 class ReadCheckpoint(models.Model):
     discussion = models.ForeignKey(Discussion, on_delete=models.CASCADE)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     last_message_read = models.ForeignKey(Message, on_delete=SET_WITH(get_previous_message),
                                           null=True)  # null=True because the user might not have read any messages yet
     read_at = models.DateTimeField(null=True)  # null=True because the user might not have read any messages yet
+    # Number of messages created after last_message_read, maintained by increment_unread_counts and read_until
+    unread_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ReadCheckpointManager()
 
     # If last_message_read is None and read_at is None, the user has not even opened the discussion yet
     # If last_message_read is None and read_at is not None, the user has opened the discussion (but there were no messages)
@@ -137,6 +197,9 @@ class ReadCheckpoint(models.Model):
         indexes = [
             # To quickly get the checkpoint for a user in a discussion
             models.Index(fields=['discussion', 'user']),
+            # To quickly sum the unread messages of a user, see ReadCheckpointManager.get_num_unread_messages
+            models.Index(fields=['user'], include=['unread_count'], condition=Q(unread_count__gt=0),
+                         name='readcheckpoint_unread_idx'),
         ]
 
     def read_messages(self):
@@ -156,7 +219,8 @@ class ReadCheckpoint(models.Model):
             # Therefore, we set read_at to the current time
             if self.read_at is None:
                 self.read_at = datetime.now()
-                self.save()
+                # Only read_at is saved, the in-memory unread_count may be outdated by a concurrent message
+                self.save(update_fields=['read_at'])
             return 0
 
         # Update the ReadCheckpoint
@@ -164,15 +228,42 @@ class ReadCheckpoint(models.Model):
 
         return num_messages_read
 
+    @transaction.atomic
     def read_until(self, message):
         """
         Set the message as the latest message read by the user.
 
         :param message: Message
         """
+        # Lock the checkpoint before counting. A message sent concurrently is then either committed before the count
+        # (and counted) or increments the counter after this update (see increment_unread_counts), instead of having
+        # its increment overwritten.
+        ReadCheckpoint.objects.select_for_update().only('id').get(id=self.id)
+
         self.last_message_read = message
         self.read_at = datetime.now()
-        self.save()
+
+        # Recompute the number of unread messages since messages could have been sent after the given message
+        unread_messages = Message.objects.filter(discussion_id=self.discussion_id)
+        if message is not None:
+            unread_messages = unread_messages.filter(created_at__gt=message.created_at)
+        self.unread_count = unread_messages.count()
+
+        self.save(update_fields=['last_message_read', 'read_at', 'unread_count'])
 
     def __str__(self):
         return f"ReadCheckpoint for {self.user} in discussion on \"{self.discussion.debate.title}\""
+
+
+@receiver(post_save, sender=Message)
+def increment_unread_counts(sender, instance, created, **kwargs):
+    """
+    Increment the unread counter of the other participant when a message is sent.
+    The counter of the author is reset by the sender when its checkpoint is moved to the message (see read_until).
+    """
+    if created:
+        ReadCheckpoint.objects.filter(
+            discussion_id=instance.discussion_id
+        ).exclude(
+            user_id=instance.author_id
+        ).update(unread_count=F('unread_count') + 1)
@@ -1,14 +1,14 @@
 from datetime import timedelta, datetime
 
 from django.core.paginator import Paginator
-from django.db.models import Q, F, BooleanField, When, Case, Value, Window, DateTimeField, Subquery, OuterRef
+from django.db.models import Q, F, BooleanField, When, Case, Value, Subquery, OuterRef
 from django.contrib.auth.decorators import login_required
 from django.db.models.functions import Greatest, Coalesce
-from django.db.models.functions.window import Lag
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.decorators.http import require_POST
 
 from ProjectOpenDebate.common.decorators import login_required_htmx
+from ProjectOpenDebate.common.pagination import paginate_keyset
 from discussion.forms import MessageForm
 from discussion.models import Discussion, Message, ReadCheckpoint
 from django.http import HttpResponseForbidden, HttpResponseNotFound
@@ -149,7 +149,7 @@ def get_current_chat_page(request, discussion_id):
     discussion_instance = get_object_or_404(
         Discussion.objects  # TODO: should we return 403 if the user is not a participant?
         .filter(Q(participant1=request.user) | Q(participant2=request.user))
-        .prefetch_related('message_set', 'readcheckpoint_set')
+        .prefetch_related('readcheckpoint_set')
         .select_related('debate', 'participant1', 'participant2'), pk=discussion_id)
 
     # Check if the conversation should be marked as archived for the current user
@@ -160,7 +160,7 @@ def get_current_chat_page(request, discussion_id):
     read_checkpoint = discussion_instance.readcheckpoint_set.exclude(user=request.user).first()
 
     # Get the messages
-    messages = discussion_instance.message_set.order_by('-created_at').annotate(
+    messages = discussion_instance.message_set.annotate(
         is_current_user=Case(
             When(author=request.user, then=Value(True)),
             default=Value(False),
@@ -168,19 +168,15 @@ def get_current_chat_page(request, discussion_id):
         )
     )
 
-    # Add annotations for detecting group changes based on time differences
-    messages = messages.annotate(
-        # Get the timestamp of the previous message in the window
-        prev_message_created_at=Window(
-            expression=Lag('created_at', offset=1),
-            order_by=F('created_at').asc(),
-            output_field=DateTimeField()
-        )
-    )
+    # Get the page of messages, newest first, starting before the cursor (if any)
+    page = paginate_keyset(messages, ('-created_at', '-id'), cursor=request.GET.get('cursor'), page_size=30)
 
-    # Create the paginator
-    paginator = Paginator(messages, 30)
-    page = paginator.get_page(request.GET.get('page', '1'))
+    # Set the timestamp of the previous message for detecting group changes based on time differences
+    # The previous message of each message is the next one in the page, except for the oldest message of the page
+    # whose previous message is the boundary object (the newest message of the next page, if any)
+    previous_messages = page.object_list[1:] + [page.boundary_object]
+    for message, previous_message in zip(page.object_list, previous_messages):
+        message.prev_message_created_at = previous_message.created_at if previous_message else None
 
     # Add the additional fields (first_of_group, formatted_datetime) to the messages
     # This will be used to add time separators in the chat
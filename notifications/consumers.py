@@ -1,8 +1,11 @@
+from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
 from django.db.models import Q
 
+from ProjectOpenDebate.common.publishing import apublish
 from ProjectOpenDebate.consumers import CustomBaseConsumer, get_user_group_name
-from .models import Notification
+from .forms import NotificationScopeForm
+from .models import Notification, bump_unread_count_version, get_bulk_update_event
 
 
 class NotificationConsumer(CustomBaseConsumer):
@@ -21,6 +24,12 @@ class NotificationConsumer(CustomBaseConsumer):
         # Get the data from the content
         data = content.get('data', {})
 
+        # Bulk events do not target a single notification
+        event_type = str(content.get('event_type', ''))
+        if event_type in ('bulk_set_read', 'bulk_delete'):
+            await self.process_bulk_event(self.scope['user'], event_type, data)
+            return
+
         # check that we have an integer notification_id and an event_type
         notification_id = data.get('notification_id')
         event_type = str(content.get('event_type', ''))
@@ -54,9 +63,12 @@ class NotificationConsumer(CustomBaseConsumer):
         notification.read = is_read
         await notification.asave()
 
+        # The number of unread notifications displayed in the navbar changed
+        await sync_to_async(bump_unread_count_version)(user.id)
+
         # Send message to the user group to update the notification list
         user_group_name = get_user_group_name(self.__class__.__name__, user.id)
-        await self.channel_layer.group_send(
+        await apublish(
             user_group_name,
             {
                 'status': 'success',
@@ -68,3 +80,32 @@ class NotificationConsumer(CustomBaseConsumer):
                 }
             }
         )
+
+    async def process_bulk_event(self, user, event_type, data):
+        # Get the notifications affected by the event
+        scope_form = NotificationScopeForm(data)
+        if not scope_form.is_valid():
+            await self.send_json({'status': 'error', 'message': 'Invalid scope'})
+            return
+
+        # Update or delete all the notifications in the scope at once
+        if event_type == 'bulk_set_read':
+            is_read = data.get('is_read')
+            if not isinstance(is_read, bool):
+                await self.send_json({'status': 'error', 'message': 'Invalid read status'})
+                return
+
+            action = 'read' if is_read else 'unread'
+            num_affected = await database_sync_to_async(Notification.objects.set_read_in_bulk)(
+                user, is_read, **scope_form.cleaned_data
+            )
+        else:
+            action = 'delete'
+            num_affected = await database_sync_to_async(Notification.objects.delete_in_bulk)(
+                user, **scope_form.cleaned_data
+            )
+
+        # Send a single message to the user group to update the notification lists and the badge
+        num_unread = await database_sync_to_async(Notification.objects.get_unread_count)(user)
+        user_group_name = get_user_group_name(self.__class__.__name__, user.id)
+        await apublish(user_group_name, get_bulk_update_event(action, num_affected, num_unread))
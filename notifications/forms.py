@@ -0,0 +1,10 @@
+from django import forms
+
+
+class NotificationScopeForm(forms.Form):
+    """
+    Selects the notifications affected by a bulk operation. All the notifications of the user are selected if no
+    field is given.
+    """
+    older_than = forms.DateTimeField(required=False)
+    notification_type = forms.CharField(required=False, max_length=255)
@@ -1,13 +1,19 @@
+from ProjectOpenDebate.common.badges import set_lazy_badge
+from notifications.models import Notification
 
 
 class NotificationMiddleware:
-    """Adds num_unread_notifications to the request,user object."""
+    """
+    Adds num_unread_notifications to the request,user object. The value is only computed if it is used.
+    The count is cached, see NotificationManager.get_unread_count.
+    """
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
         if request.user.is_authenticated:
-            request.user.num_unread_notifications = request.user.notification_set.filter(read=False).count()
+            user = request.user
+            set_lazy_badge(request, 'num_unread_notifications', lambda: Notification.objects.get_unread_count(user))
 
         response = self.get_response(request)
 
@@ -0,0 +1,48 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:51
+
+from django.db import migrations, models
+
+
+def backfill_rendered_text(apps, schema_editor):
+    """Render the text of the existing notifications from the templates of their type."""
+    Notification = apps.get_model('notifications', 'Notification')
+
+    notifications = []
+    for notification in Notification.objects.select_related('notification_type').iterator(chunk_size=1000):
+        notification_type = notification.notification_type
+        notification.title = notification_type.title_template.format(**notification.data)
+        notification.message = notification_type.message_template.format(**notification.data)
+        notification.endnote = notification_type.endnote_template.format(**notification.data)
+        notifications.append(notification)
+
+        if len(notifications) == 1000:
+            Notification.objects.bulk_update(notifications, ['title', 'message', 'endnote'])
+            notifications = []
+
+    Notification.objects.bulk_update(notifications, ['title', 'message', 'endnote'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_notification_user_read_created_at_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='endnote',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='message',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='title',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(backfill_rendered_text, migrations.RunPython.noop),
+    ]
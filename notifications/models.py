@@ -1,16 +1,96 @@
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+import time
+
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
-from django.db.models import Subquery
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Count
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django.template.loader import render_to_string
+from django.template.loader import get_template
 from django.urls import reverse
+from django.utils.timezone import now
 
+from ProjectOpenDebate.common.publishing import publish_many
 from ProjectOpenDebate.consumers import get_user_group_name
 
+UNREAD_COUNT_CACHE_TIMEOUT = 60 * 60  # Bounds how long a missed invalidation can leave a stale count
+NOTIFICATION_TYPES_MAX_AGE = 5 * 60  # Bounds how long other processes can use notification types changed elsewhere
+
+
+def get_unread_count_version_key(user_id):
+    return f'notifications:unread_count_version:{user_id}'
+
+
+def get_unread_count_cache_key(user_id, version):
+    return f'notifications:unread_count:{user_id}:{version}'
+
+
+def bump_unread_count_version(user_id):
+    """
+    Invalidate the cached number of unread notifications of the user by moving it to a new version.
+    Unlike deleting the cached count, this also invalidates a count computed before the invalidation but cached after
+    it: it is cached under the previous version, which is never read again.
+    """
+    version_key = get_unread_count_version_key(user_id)
+    cache.add(version_key, 0, timeout=None)
+    cache.incr(version_key)
+
+
+class NotificationTypeManager(models.Manager):
+    """
+    Keeps every NotificationType in memory since there are only a few of them and they rarely change. This way,
+    creating and rendering notifications does not require any query to get their type.
+
+    The registry is cleared whenever a NotificationType is saved or deleted in this process. Other processes reload it
+    once it is older than NOTIFICATION_TYPES_MAX_AGE.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Note: the dict is mutated in place since the manager is shallow copied by Django
+        self._registry = {}
+
+    def _get_registry(self):
+        if not self._registry or time.monotonic() - self._registry['loaded_at'] > NOTIFICATION_TYPES_MAX_AGE:
+            notification_types = list(self.all())
+            self._registry.update({
+                'by_name': {notification_type.name: notification_type for notification_type in notification_types},
+                'by_id': {notification_type.id: notification_type for notification_type in notification_types},
+                'loaded_at': time.monotonic(),
+            })
+
+        return self._registry
+
+    def get_for_name(self, name):
+        """
+        Get the NotificationType with the given name from the registry.
+
+        :param name: The name of the NotificationType
+        :return: The NotificationType instance
+        :raises NotificationType.DoesNotExist: If there is no NotificationType with this name
+        """
+        try:
+            return self._get_registry()['by_name'][name]
+        except KeyError:
+            raise self.model.DoesNotExist(f'NotificationType with name "{name}" does not exist')
+
+    def get_for_id(self, notification_type_id):
+        """
+        Get the NotificationType with the given id from the registry.
+
+        :param notification_type_id: The id of the NotificationType
+        :return: The NotificationType instance
+        :raises NotificationType.DoesNotExist: If there is no NotificationType with this id
+        """
+        try:
+            return self._get_registry()['by_id'][notification_type_id]
+        except KeyError:
+            raise self.model.DoesNotExist(f'NotificationType with id {notification_type_id} does not exist')
+
+    def clear_registry(self):
+        self._registry.clear()
+
 
 class NotificationType(models.Model):
     name = models.CharField(max_length=255)
@@ -18,21 +98,156 @@ class NotificationType(models.Model):
     message_template = models.CharField(max_length=2000)
     endnote_template = models.CharField(max_length=255, blank=True)
 
+    objects = NotificationTypeManager()
+
     def __str__(self):
         return self.name
 
 
 class NotificationManager(models.Manager):
-    def get_queryset(self):
-        return super().get_queryset().select_related('notification_type')
+    def get_unread_count(self, user):
+        """
+        Get the number of unread notifications of the user. The count is cached until a notification of the user is
+        created, read, unread or deleted (see invalidate_unread_count).
 
-    def create_new_discussion_notification(self, user_to_notify, other_user_name, discussion_id, debate_title):
-        """ Create a new discussion notification for the user. """
-        return self.create(
+        :param user: The user instance
+        :return: The number of unread notifications
+        """
+        # Read the version first: if the count is invalidated while it is computed, it is cached under a stale version
+        version = cache.get(get_unread_count_version_key(user.id), 0)
+        cache_key = get_unread_count_cache_key(user.id, version)
+        unread_count = cache.get(cache_key)
+        if unread_count is None:
+            unread_count = self.filter(user=user, read=False).count()
+            cache.set(cache_key, unread_count, UNREAD_COUNT_CACHE_TIMEOUT)
+
+        return unread_count
+
+    def invalidate_unread_count(self, user_id):
+        """
+        Invalidate the cached number of unread notifications of the user once the current transaction is committed.
+        This must be called whenever the read status of a notification of the user changes or a notification is
+        created or deleted.
+
+        :param user_id: The id of the user
+        """
+        transaction.on_commit(lambda: bump_unread_count_version(user_id))
+
+    def get_scope(self, user, older_than=None, notification_type=None):
+        """
+        Get the notifications of the user affected by a bulk operation.
+
+        :param user: The user instance
+        :param older_than: If given, only the notifications created before this datetime are selected
+        :param notification_type: If given, only the notifications of the NotificationType with this name are selected
+        :return: A queryset of notifications
+        """
+        notifications = self.filter(user=user)
+        if older_than is not None:
+            notifications = notifications.filter(created_at__lt=older_than)
+        if notification_type:
+            # Resolve the name from the registry to filter on the foreign key without joining NotificationType
+            try:
+                notification_type_id = NotificationType.objects.get_for_name(notification_type).id
+            except NotificationType.DoesNotExist:
+                return self.none()
+            notifications = notifications.filter(notification_type_id=notification_type_id)
+
+        return notifications
+
+    def set_read_in_bulk(self, user, is_read, **scope):
+        """
+        Set the read status of all the notifications of the user in the scope with a single UPDATE.
+
+        :param user: The user instance
+        :param is_read: The read status to set
+        :param scope: The scope of the notifications, see get_scope
+        :return: The number of notifications whose read status changed
+        """
+        num_updated = self.get_scope(user, **scope).exclude(read=is_read).update(read=is_read)
+        if num_updated:
+            self.invalidate_unread_count(user.id)
+
+        return num_updated
+
+    def delete_in_bulk(self, user, **scope):
+        """
+        Delete all the notifications of the user in the scope with a single DELETE.
+
+        :param user: The user instance
+        :param scope: The scope of the notifications, see get_scope
+        :return: The number of deleted notifications
+        """
+        num_deleted, _ = self.get_scope(user, **scope).delete()
+        if num_deleted:
+            self.invalidate_unread_count(user.id)
+
+        return num_deleted
+
+    def prune(self, max_age, max_read_per_user, batch_size=1000):
+        """
+        Delete the read notifications that are older than max_age or that are beyond the max_read_per_user most recent
+        read notifications of their user. Unread notifications are never deleted.
+
+        The notifications are deleted in batches of batch_size to keep the transactions short. Since only read
+        notifications are deleted, the cached unread counts stay valid.
+
+        :param max_age: A timedelta, the read notifications older than this are deleted
+        :param max_read_per_user: The number of most recent read notifications kept for each user
+        :param batch_size: The maximum number of notifications deleted per query
+        :return: The number of deleted notifications
+        """
+        num_deleted = 0
+
+        # Delete the read notifications that are too old
+        old_notifications = self.filter(read=True, created_at__lt=now() - max_age)
+        num_deleted += self._delete_in_batches(old_notifications, batch_size)
+
+        # Delete the oldest read notifications of the users that have too many of them
+        # This uses the (user, read, -created_at) index to skip the most recent read notifications of each user
+        users_over_limit = self.filter(read=True).values('user').annotate(
+            num_read=Count('id')
+        ).filter(num_read__gt=max_read_per_user).values_list('user', flat=True)
+        for user_id in users_over_limit:
+            extra_notifications = self.filter(user_id=user_id, read=True).order_by('-created_at')[max_read_per_user:]
+            num_deleted += self._delete_in_batches(extra_notifications, batch_size)
+
+        return num_deleted
+
+    def _delete_in_batches(self, notifications, batch_size):
+        num_deleted = 0
+        while True:
+            batch_ids = list(notifications.values_list('id', flat=True)[:batch_size])
+            if not batch_ids:
+                return num_deleted
+
+            num_batch_deleted, _ = self.filter(id__in=batch_ids).delete()
+            num_deleted += num_batch_deleted
+
+    def create_in_bulk(self, notifications):
+        """
+        Create the notifications with a single INSERT and send them to their users once the transaction is committed.
+        Unlike create, this does not send the post_save signal.
+
+        :param notifications: Unsaved Notification instances, e.g. from the build_*_notification methods
+        :return: The created notifications
+        """
+        for notification in notifications:
+            notification.render_text()
+
+        notifications = self.bulk_create(notifications)
+
+        for user_id in {notification.user_id for notification in notifications}:
+            self.invalidate_unread_count(user_id)
+        publish_notifications(notifications)
+
+        return notifications
+
+    def build_new_discussion_notification(self, user_to_notify, other_user_name, discussion_id, debate_title):
+        """ Build (without saving) a new discussion notification for the user. """
+        return self.model(
             user_id=user_to_notify,
-            notification_type_id=Subquery(
-                NotificationType.objects.filter(name='new_discussion').values('id')[:1]
-            ),
+            notification_type=NotificationType.objects.get_for_name('new_discussion'),
             data={
                 'debate_title': debate_title,
                 'participant_username': other_user_name
@@ -41,10 +256,10 @@ class NotificationManager(models.Manager):
             url_args={'discussion_id': discussion_id}
         )
 
-    def create_new_message_notification(self, user, message):
-        return self.create(
+    def build_new_message_notification(self, user, message):
+        return self.model(
             user=user,
-            notification_type=NotificationType.objects.get(name='new_message'),
+            notification_type=NotificationType.objects.get_for_name('new_message'),
             data={
                 'debate_title': message.discussion.debate.title,
                 'participant_username': message.author.username
@@ -53,10 +268,10 @@ class NotificationManager(models.Manager):
             url_args={'discussion_id': message.discussion.id}
         )
 
-    def create_accepted_invite_notification(self, invite, invite_use, accepting_user):
-        return self.create(
+    def build_accepted_invite_notification(self, invite, invite_use, accepting_user):
+        return self.model(
             user=invite.creator,
-            notification_type=NotificationType.objects.get(name='accepted_invite'),
+            notification_type=NotificationType.objects.get_for_name('accepted_invite'),
             data={
                 'debate_title': invite.debate.title,
                 'participant_username': accepting_user.username,
@@ -65,6 +280,19 @@ class NotificationManager(models.Manager):
             url_args={'discussion_id': invite_use.resulting_discussion.id}
         )
 
+    def create_new_discussion_notification(self, user_to_notify, other_user_name, discussion_id, debate_title):
+        """ Create a new discussion notification for the user. """
+        notification = self.build_new_discussion_notification(
+            user_to_notify, other_user_name, discussion_id, debate_title
+        )
+        return self.create_in_bulk([notification])[0]
+
+    def create_new_message_notification(self, user, message):
+        return self.create_in_bulk([self.build_new_message_notification(user, message)])[0]
+
+    def create_accepted_invite_notification(self, invite, invite_use, accepting_user):
+        return self.create_in_bulk([self.build_accepted_invite_notification(invite, invite_use, accepting_user)])[0]
+
 
 class Notification(models.Model):
     user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
@@ -88,19 +316,40 @@ class Notification(models.Model):
     url_name = models.CharField(max_length=255, blank=True)
     url_args = models.JSONField(default=dict)
 
+    # The text of the notification is rendered once from the templates of its type, see render_text
+    title = models.TextField(blank=True)
+    message = models.TextField(blank=True)
+    endnote = models.TextField(blank=True)
+
     objects = NotificationManager()
 
-    @property
-    def title(self):
-        return self.notification_type.title_template.format(**self.data)
+    class Meta:
+        indexes = [
+            # To quickly get the (unread) notifications of a user, newest first
+            models.Index(fields=['user', 'read', '-created_at']),
+        ]
 
     @property
-    def message(self):
-        return self.notification_type.message_template.format(**self.data)
+    def cached_notification_type(self):
+        """The NotificationType of the notification, taken from the registry instead of the database."""
+        return NotificationType.objects.get_for_id(self.notification_type_id)
 
-    @property
-    def endnote(self):
-        return self.notification_type.endnote_template.format(**self.data)
+    def render_text(self):
+        """
+        Render the title, message and endnote of the notification from the templates of its type and its data.
+        This is done automatically when the notification is saved for the first time. It must be called explicitly
+        when the notification is created without calling save (e.g. with bulk_create).
+        """
+        notification_type = self.cached_notification_type
+        self.title = notification_type.title_template.format(**self.data)
+        self.message = notification_type.message_template.format(**self.data)
+        self.endnote = notification_type.endnote_template.format(**self.data)
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.title:
+            self.render_text()
+
+        super().save(*args, **kwargs)
 
     @property
     def redirect_url(self):
@@ -110,33 +359,72 @@ class Notification(models.Model):
         return f'Notification for {self.user.username} at {self.created_at}'
 
 
+@receiver([post_save, post_delete], sender=NotificationType)
+def clear_notification_type_registry(sender, **kwargs):
+    """
+    Clear the NotificationType registry of this process so that it is reloaded with the changes.
+    """
+    NotificationType.objects.clear_registry()
+
+
+def publish_notifications(notifications):
+    """
+    Send the notifications to their users using the WebSocket. The events are written to the outbox in the current
+    transaction, so they are only sent once it is committed (see ProjectOpenDebate.common.publishing).
+
+    :param notifications: Saved Notification instances
+    """
+    template = get_template('notifications/notification.html')
+
+    publish_many([
+        (
+            get_user_group_name('NotificationConsumer', notification.user_id),
+            {
+                'status': 'success',
+                'event_type': 'new_notification',
+                'type': 'send.json',
+                'data': {
+                    'notification_id': notification.id,
+                    'html': template.render({'notification': notification})
+                }
+            }
+        )
+        for notification in notifications
+    ])
+
+
 @receiver(post_save, sender=Notification)
 def send_notification(sender, instance, created, **kwargs):
     """
     Send the notification to the user using the WebSocket.
+    Note: the notifications created with NotificationManager.create_in_bulk are sent by create_in_bulk itself.
     """
     if not created:
         return
 
-    # Get current channel layer
-    channel_layer = get_channel_layer()
-
-    # Get the user group name
-    user_group_name = get_user_group_name('NotificationConsumer', instance.user_id)
-
-    # Render the notification data
-    html = render_to_string('notifications/notification.html', {'notification': instance})
-
-    # Send the notification to the user
-    async_to_sync(channel_layer.group_send)(
-        user_group_name,
-        {
-            'status': 'success',
-            'event_type': 'new_notification',
-            'type': 'send.json',
-            'data': {
-                'notification_id': instance.id,
-                'html': html
-            }
+    # The user has a new unread notification
+    Notification.objects.invalidate_unread_count(instance.user_id)
+
+    publish_notifications([instance])
+
+
+def get_bulk_update_event(action, num_affected, num_unread):
+    """
+    Get the event sent to the user after a bulk operation on their notifications. A single event is sent for the
+    whole operation, no matter how many notifications were affected.
+
+    :param action: 'read', 'unread' or 'delete'
+    :param num_affected: The number of notifications affected by the operation
+    :param num_unread: The number of unread notifications of the user after the operation
+    :return: The event to send to the user group of the NotificationConsumer
+    """
+    return {
+        'status': 'success',
+        'event_type': 'bulk_update',
+        'type': 'send.json',
+        'data': {
+            'action': action,
+            'num_affected': num_affected,
+            'num_unread': num_unread
         }
-    )
+    }
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from django.conf import settings
+
+from .models import Notification
+
+logger = get_task_logger(__name__)
+
+
+@shared_task
+def prune_notifications():
+    """
+    Deletes the read notifications that are beyond the retention settings (NOTIFICATION_RETENTION_DAYS and
+    NOTIFICATION_MAX_READ_PER_USER) so that the notification table does not grow forever.
+    """
+    logger.info('Pruning notifications')
+
+    num_deleted = Notification.objects.prune(
+        max_age=timedelta(days=settings.NOTIFICATION_RETENTION_DAYS),
+        max_read_per_user=settings.NOTIFICATION_MAX_READ_PER_USER,
+        batch_size=settings.NOTIFICATION_PRUNE_BATCH_SIZE
+    )
+
+    logger.info(f'Pruned {num_deleted} notifications')
@@ -4,5 +4,7 @@ import notifications.views
 urlpatterns = [
     path('page/', notifications.views.get_notifications_page, name='get_notifications_page'),
     path('delete/<int:notification_id>/', notifications.views.delete_notification, name='delete_notification'),
+    path('bulk/read/', notifications.views.set_read_in_bulk, name='set_notifications_read_in_bulk'),
+    path('bulk/delete/', notifications.views.delete_in_bulk, name='delete_notifications_in_bulk'),
     path('', notifications.views.list_notifications, name='list_notifications'),
 ]
@@ -1,27 +1,27 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator, EmptyPage
 from django.http import HttpResponseBadRequest, HttpResponse
 from django.shortcuts import render
 from django.views.decorators.http import require_POST
 
 from ProjectOpenDebate.common.decorators import login_required_htmx
+from ProjectOpenDebate.common.pagination import paginate_keyset
+from ProjectOpenDebate.common.publishing import publish
+from ProjectOpenDebate.consumers import get_user_group_name
+from notifications.forms import NotificationScopeForm
+from notifications.models import Notification, get_bulk_update_event
 
 
 @login_required_htmx
 def get_notifications_page(request):
-    notifications = request.user.notification_set.all().order_by('-created_at')
+    notifications = request.user.notification_set.all()
 
     unread_only = request.GET.get('unread_only', 'false').lower() == 'true'
     is_dropdown = request.GET.get('dropdown', 'false').lower() == 'true'
     if unread_only:
         notifications = notifications.filter(read=False)
 
-    # Paginate the notifications
-    paginator = Paginator(notifications, 10)
-    try:
-        page = paginator.page(request.GET.get('page', '1'))
-    except EmptyPage:
-        return HttpResponseBadRequest('Invalid page number')
+    # Paginate the notifications, newest first
+    page = paginate_keyset(notifications, ('-created_at', '-id'), cursor=request.GET.get('cursor'), page_size=10)
 
     context = {
         'page': page,
@@ -40,5 +40,42 @@ def list_notifications(request):
 @login_required_htmx
 @require_POST
 def delete_notification(request, notification_id):
-    request.user.notification_set.filter(id=notification_id).delete()
+    num_deleted, _ = request.user.notification_set.filter(id=notification_id).delete()
+    if num_deleted:
+        Notification.objects.invalidate_unread_count(request.user.id)
+    return HttpResponse(status=204)
+
+
+def send_bulk_update_event(user, action, num_affected):
+    """
+    Send a single event to all the connections of the user to update their notifications after a bulk operation.
+    """
+    event = get_bulk_update_event(action, num_affected, Notification.objects.get_unread_count(user))
+    publish(get_user_group_name('NotificationConsumer', user.id), event)
+
+
+@login_required_htmx
+@require_POST
+def set_read_in_bulk(request):
+    scope_form = NotificationScopeForm(request.POST)
+    if not scope_form.is_valid():
+        return HttpResponseBadRequest('Invalid scope')
+
+    is_read = request.POST.get('is_read', 'true').lower() == 'true'
+    num_updated = Notification.objects.set_read_in_bulk(request.user, is_read, **scope_form.cleaned_data)
+    send_bulk_update_event(request.user, 'read' if is_read else 'unread', num_updated)
+
+    return HttpResponse(status=204)
+
+
+@login_required_htmx
+@require_POST
+def delete_in_bulk(request):
+    scope_form = NotificationScopeForm(request.POST)
+    if not scope_form.is_valid():
+        return HttpResponseBadRequest('Invalid scope')
+
+    num_deleted = Notification.objects.delete_in_bulk(request.user, **scope_form.cleaned_data)
+    send_bulk_update_event(request.user, 'delete', num_deleted)
+
     return HttpResponse(status=204)
@@ -0,0 +1,60 @@
+import select
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ProjectOpenDebate.common.publishing import OUTBOX_NOTIFY_CHANNEL
+from outbox.models import OutboxEvent
+
+
+class Command(BaseCommand):
+    help = ('Sends the events of the outbox to the channel layer. It runs until interrupted, waking up on the NOTIFY '
+            'sent with every new event. Several relays can run at the same time. It is required for the events '
+            'to be sent, OUTBOX_RELAY_INLINE only sends them earlier when possible.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_RELAY_BATCH_SIZE,
+                            help='Maximum number of events sent per batch')
+        parser.add_argument('--poll-interval', type=float, default=settings.OUTBOX_RELAY_POLL_INTERVAL,
+                            help='Seconds to wait for a NOTIFY before checking the outbox anyway')
+        parser.add_argument('--once', action='store_true',
+                            help='Send the pending events and exit instead of waiting for new ones')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            num_sent = OutboxEvent.objects.relay(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Sent {num_sent} events.'))
+            return
+
+        # Django connections are in autocommit mode, so the LISTEN takes effect right away
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {OUTBOX_NOTIFY_CHANNEL}')
+        pg_connection = connection.connection
+
+        self.stdout.write(f'Relaying the outbox events (listening on "{OUTBOX_NOTIFY_CHANNEL}")...')
+        while True:
+            # Notifications received while relaying are consumed as well since the relay sends everything pending
+            pg_connection.notifies.clear()
+
+            try:
+                start = time.perf_counter()
+                num_sent = OutboxEvent.objects.relay(batch_size=options['batch_size'])
+            except Exception as e:
+                # The events stay in the outbox, retry after the poll interval
+                self.stderr.write(f'Could not relay the events: {e}')
+                time.sleep(options['poll_interval'])
+                continue
+
+            if num_sent:
+                elapsed = (time.perf_counter() - start) * 1000
+                self.stdout.write(f'Sent {num_sent} events in {elapsed:.1f}ms.')
+
+            # A NOTIFY may have been received during the relay, in which case the socket is already drained
+            if pg_connection.notifies:
+                continue
+
+            # Wait for a NOTIFY or the poll interval
+            if select.select([pg_connection], [], [], options['poll_interval']) != ([], [], []):
+                pg_connection.poll()
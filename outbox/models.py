@@ -0,0 +1,129 @@
+import asyncio
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils.timezone import now
+
+
+def send_events(events, timeout=None):
+    """
+    Send the events to the channel layer right away, in a single batch.
+
+    The groups are sent to concurrently but the events of a same group are sent in the order of the list.
+
+    :param events: A list of (group, message) tuples
+    :param timeout: The maximum number of seconds spent sending, or None to wait until all the events are sent
+    :raises TimeoutError: If the events could not be sent within the timeout, some of them may have been sent
+    """
+    if not events:
+        return
+
+    events_per_group = {}
+    for group, message in events:
+        events_per_group.setdefault(group, []).append(message)
+
+    async def send_group_events(channel_layer, group, messages):
+        for message in messages:
+            await channel_layer.group_send(group, message)
+
+    async def send_all_events():
+        channel_layer = get_channel_layer()
+        await asyncio.wait_for(asyncio.gather(*(
+            send_group_events(channel_layer, group, messages) for group, messages in events_per_group.items()
+        )), timeout)
+
+    async_to_sync(send_all_events)()
+
+
+class OutboxEventManager(models.Manager):
+    def relay(self, batch_size=500):
+        """
+        Send the pending events to the channel layer in batches of batch_size, by increasing id.
+
+        Each batch is locked with SKIP LOCKED so that concurrent relays (e.g. several relay_outbox commands or an inline
+        relay) never send the same event twice. As a consequence, the batches of concurrent relays are sent in no
+        particular order, see ProjectOpenDebate.common.publishing.publish_many. If sending a batch fails (e.g. the
+        channel layer is unavailable), the batch stays pending and the exception is raised.
+
+        :param batch_size: The maximum number of events sent per batch
+        :return: The number of events sent
+        """
+        num_sent = 0
+        while True:
+            with transaction.atomic():
+                events = list(
+                    self.select_for_update(skip_locked=True).filter(
+                        published_at__isnull=True
+                    ).order_by('id')[:batch_size]
+                )
+                if not events:
+                    return num_sent
+
+                send_events([(event.group, event.message) for event in events])
+                self.filter(id__in=[event.id for event in events]).update(published_at=now())
+
+            num_sent += len(events)
+
+    def relay_events(self, event_ids, timeout=None):
+        """
+        Send the given events to the channel layer if they are still pending, e.g. the events written by a transaction
+        right after it commits. The events being sent by another relay are skipped.
+
+        If sending the events fails or times out, they stay pending for the relay_outbox command and the exception is
+        raised.
+
+        :param event_ids: The ids of the events
+        :param timeout: The maximum number of seconds spent sending, see send_events
+        :return: The number of events sent
+        """
+        with transaction.atomic():
+            events = list(
+                self.select_for_update(skip_locked=True).filter(
+                    id__in=event_ids,
+                    published_at__isnull=True
+                ).order_by('id')
+            )
+            if not events:
+                return 0
+
+            send_events([(event.group, event.message) for event in events], timeout=timeout)
+            self.filter(id__in=[event.id for event in events]).update(published_at=now())
+
+        return len(events)
+
+    def prune(self, max_age):
+        """
+        Delete the events that were published more than max_age ago.
+
+        :param max_age: A timedelta
+        :return: The number of deleted events
+        """
+        num_deleted, _ = self.filter(published_at__lt=now() - max_age).delete()
+        return num_deleted
+
+
+class OutboxEvent(models.Model):
+    """
+    An event to send to a group of the channel layer. The events are written in the same transaction as the changes
+    they are about and sent by a relay once committed, see ProjectOpenDebate.common.publishing.
+    """
+    group = models.CharField(max_length=255)
+    message = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+
+    objects = OutboxEventManager()
+
+    class Meta:
+        indexes = [
+            # To quickly get the pending events, oldest first
+            models.Index(fields=['id'], condition=Q(published_at__isnull=True), name='outbox_pending_idx'),
+            # To quickly prune the published events
+            models.Index(fields=['published_at'], condition=Q(published_at__isnull=False), name='outbox_published_idx'),
+        ]
+
+    def __str__(self):
+        status = f'published at {self.published_at}' if self.published_at else 'pending'
+        return f'OutboxEvent {self.id} for {self.group} ({status})'
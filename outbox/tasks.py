@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from django.conf import settings
+
+from .models import OutboxEvent
+
+logger = get_task_logger(__name__)
+
+
+@shared_task
+def prune_outbox_events():
+    """
+    Deletes the published outbox events older than OUTBOX_RETENTION_HOURS so that the outbox table stays small.
+    """
+    logger.info('Pruning outbox events')
+
+    num_deleted = OutboxEvent.objects.prune(max_age=timedelta(hours=settings.OUTBOX_RETENTION_HOURS))
+
+    logger.info(f'Pruned {num_deleted} outbox events')
@@ -1,11 +1,15 @@
 import asyncio
 
+from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
 from django.db import transaction
 from django.template.loader import render_to_string
+from redis import RedisError
 
-from ProjectOpenDebate.consumers import CustomBaseConsumer, get_user_group_name
+from ProjectOpenDebate.common.publishing import publish_many, apublish
+from ProjectOpenDebate.consumers import CustomBaseConsumer, get_user_group_name, get_redirect_event
 from debate.models import Debate
+from pairing import presence
 from pairing.models import PairingRequest, PairingMatch
 
 
@@ -63,17 +67,29 @@ class PairingConsumer(CustomBaseConsumer):
             await self.send_json({'status': 'error', 'message': 'Invalid event_type'})
 
     async def keepalive(self, user):
-        pairing_request = await database_sync_to_async(PairingRequest.objects.get_current_request)(user)
+        # Extend the liveness of the current request, without touching the database
+        try:
+            is_alive = await sync_to_async(presence.refresh)(user.id)
+        except RedisError:
+            is_alive = False
+
+        if not is_alive:
+            # The liveness of the request was lost (e.g. Redis restarted or the keepalives were late), but the client is
+            # still there. Unless the request was already swept, it is marked alive again.
+            pairing_request = await database_sync_to_async(PairingRequest.objects.get_current_request)(
+                user, include_expired=True
+            )
 
-        if not pairing_request:
-            await self.send_json({
-                'status': 'error',
-                'no_toast': True,
-                'event_type': 'keepalive_ack',
-            })
-            return
+            if not pairing_request:
+                await self.send_json({
+                    'status': 'error',
+                    'no_toast': True,
+                    'event_type': 'keepalive_ack',
+                })
+                return
+
+            await sync_to_async(pairing_request.mark_alive)()
 
-        await database_sync_to_async(pairing_request.update_keepalive)()
         await self.send_json({
             'status': 'success',
             'event_type': 'keepalive_ack',
@@ -84,8 +100,11 @@ class PairingConsumer(CustomBaseConsumer):
     def complete_match(self, pairing_match: PairingMatch):
         """
         Completes the pairing match by creating the related discussion.
+        The users are redirected to the discussion once it is committed.
         """
-        return pairing_match.complete_match()
+        related_discussion = pairing_match.complete_match()
+        self.publish_paired_redirect(pairing_match)
+        return related_discussion
 
     async def wait_then_complete_pairing(self, pairing_match: PairingMatch):
         """
@@ -93,13 +112,11 @@ class PairingConsumer(CustomBaseConsumer):
         """
         await asyncio.sleep(3.5)
         await self.complete_match(pairing_match)
-        await self.notify_paired_redirect(pairing_match)
 
-    @database_sync_to_async
     @transaction.atomic
-    def create_pairing_match_or_fail(self, user):
+    def activate_pairing_request_or_fail(self, user):
         """
-        Creates a pairing match between the two pairing requests.
+        Marks the idle pairing request of the user as active.
         """
         # Retrieve and lock the pairing request
         pairing_request = PairingRequest.objects.get_current_request(user, for_update=True)
@@ -111,21 +128,45 @@ class PairingConsumer(CustomBaseConsumer):
         # TODO: is this really necessary?
         pairing_request.switch_status(PairingRequest.Status.ACTIVE)
 
-        # Get the best match for the pairing request
-        best_match = PairingRequest.objects.get_best_match(pairing_request, for_update=True)
-
-        # According to the postgresql documentation,
-        # "[...] rows that satisfied the query conditions as of the query snapshot will be locked,
-        #  although they will not be returned if they were updated after the snapshot and no longer
-        #  satisfy the query conditions"
-        # This means that we are guaranteed that the best match is still a valid match if we can retrieve it.
-        # Source: https://www.postgresql.org/docs/current/sql-select.html#SQL-FOR-UPDATE-SHARE
+        return pairing_request
 
-        if not best_match:
-            return pairing_request, None, None
+    @database_sync_to_async
+    def create_pairing_match_or_fail(self, user):
+        """
+        Creates a pairing match between the two pairing requests.
+        """
+        # The activation is committed before the request is queued, so a searcher popping it sees it as active
+        pairing_request = self.activate_pairing_request_or_fail(user)
 
-        # Create the pairing match
-        pairing_match = PairingMatch.objects.create_match_found(pairing_request, best_match)
+        best_match = None
+        try:
+            with transaction.atomic():
+                # Lock the pairing request again, it may have been cancelled since its activation
+                pairing_request = PairingRequest.objects.select_for_update().filter(id=pairing_request.id).first()
+                if not pairing_request or pairing_request.status != PairingRequest.Status.ACTIVE:
+                    raise NoCurrentPairingRequestException(user)
+
+                # Get the oldest matching request waiting in the matchmaking queues
+                # If there is none, the pairing request is queued until a matching searcher pops it
+                best_match = PairingRequest.objects.get_queued_match(pairing_request)
+
+                # The best match is locked and was validated after it was popped from the queue, so it is still a valid
+                # match until the end of this transaction.
+
+                if not best_match:
+                    return pairing_request, None, None
+
+                # Create the pairing match
+                pairing_match = PairingMatch.objects.create_match_found(pairing_request, best_match)
+
+                # The users are only notified if the match is committed
+                self.publish_match_found(pairing_request, best_match)
+        except Exception:
+            # The best match was popped from the queue but the match was not committed (this includes a failed commit),
+            # put it back for the next searcher
+            if best_match:
+                best_match.requeue(stance=pairing_request.desired_stance)
+            raise
 
         return pairing_request, best_match, pairing_match
 
@@ -146,8 +187,6 @@ class PairingConsumer(CustomBaseConsumer):
         if not pairing_match:
             await self.notify_start_search(pairing_request)
         else:
-            await self.notify_match_found(pairing_request, best_match)
-
             # Wait a few seconds before redirecting the users to the discussion
             # We do not await to avoid blocking the event loop
             asyncio.create_task(self.wait_then_complete_pairing(pairing_match))  # noqa
@@ -160,7 +199,7 @@ class PairingConsumer(CustomBaseConsumer):
         user_group_name = get_user_group_name(self.__class__.__name__, pairing_request.user_id)
 
         # Notify the user that the active search has started
-        await self.channel_layer.group_send(
+        await apublish(
             user_group_name,
             {
                 'status': 'success',
@@ -169,22 +208,23 @@ class PairingConsumer(CustomBaseConsumer):
             }
         )
 
-    async def notify_match_found(self, pairing_request, best_match):
+    def publish_match_found(self, pairing_request, best_match):
         """
         Notifies the two users that a match has been found and pairs them together.
+        The events are published in the current transaction, see ProjectOpenDebate.common.publishing.
         """
         # Notify the users that a match has been found
-        for _pairing_request in [pairing_request, best_match]:
-            group_name = get_user_group_name(self.__class__.__name__, _pairing_request.user_id)
-
-            await self.channel_layer.group_send(
-                group_name,
+        publish_many([
+            (
+                get_user_group_name(self.__class__.__name__, _pairing_request.user_id),
                 {
                     'status': 'success',
                     'type': 'send.json',
                     'event_type': 'match_found',
                 }
             )
+            for _pairing_request in [pairing_request, best_match]
+        ])
 
     @database_sync_to_async
     @transaction.atomic
@@ -202,6 +242,7 @@ class PairingConsumer(CustomBaseConsumer):
             raise NoCurrentPairingRequestException(user)
 
         if pairing_request.status in [PairingRequest.Status.ACTIVE, PairingRequest.Status.IDLE]:
+            pairing_request.remove_from_queues()
             pairing_request.delete()
 
             # Object is deleted in DB but not in memory, return it for the notification
@@ -233,7 +274,7 @@ class PairingConsumer(CustomBaseConsumer):
         user_group_name = get_user_group_name(self.__class__.__name__, user_id)
 
         # Notify the user that the pairing request has been cancelled
-        await self.channel_layer.group_send(
+        await apublish(
             user_group_name,
             {
                 'status': 'success',
@@ -245,13 +286,16 @@ class PairingConsumer(CustomBaseConsumer):
             }
         )
 
-    async def notify_paired_redirect(self, pairing_match):
+    def publish_paired_redirect(self, pairing_match):
         """
         Notifies the users that the pairing has been completed and redirects them to the discussion.
+        The events are published in the current transaction, see ProjectOpenDebate.common.publishing.
         """
-        for pairing_request in [pairing_match.pairing_request_1, pairing_match.pairing_request_2]:
-            await self.redirect(pairing_request.user_id, 'specific_discussion',
-                                discussion_id=pairing_match.related_discussion_id)
+        redirect_event = get_redirect_event('specific_discussion', discussion_id=pairing_match.related_discussion_id)
+        publish_many([
+            (get_user_group_name(self.__class__.__name__, pairing_request.user_id), redirect_event)
+            for pairing_request in [pairing_match.pairing_request_1, pairing_match.pairing_request_2]
+        ])
 
     @database_sync_to_async
     @transaction.atomic
@@ -267,7 +311,10 @@ class PairingConsumer(CustomBaseConsumer):
             raise PairingRequestAlreadyExistsException(user)
 
         # Create the pairing request
-        return PairingRequest.objects.create(user=user, debate=debate, desired_stance=desired_stance)
+        pairing_request = PairingRequest.objects.create(user=user, debate=debate, desired_stance=desired_stance)
+        pairing_request.mark_alive()
+
+        return pairing_request
 
     async def request_pairing(self, user, data):
         """
@@ -312,7 +359,7 @@ class PairingConsumer(CustomBaseConsumer):
         )
 
         # Notify the user that the pairing request has been created
-        await self.channel_layer.group_send(
+        await apublish(
             user_group_name,
             {
                 'status': 'success',
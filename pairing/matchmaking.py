@@ -0,0 +1,92 @@
+"""
+Matchmaking queues of the active pairing requests.
+
+The requests searching for a partner wait in Redis sorted sets, one per (debate, stance of the user, desired stance),
+ordered by the creation time of the request. A searcher pops the oldest request of the queue matching it, or pushes
+itself in its own queue if there is none, in a single atomic script. Finding a partner is therefore O(log n) in Redis
+instead of a locked scan of the pairing requests.
+
+The queues are only an index: the popped requests must still be validated (and locked) in the database, since they may
+have been cancelled or may have expired in the meantime.
+"""
+from functools import cache
+
+import redis
+from django.conf import settings
+
+QUEUE_KEY_PREFIX = 'opendebate:pairing:queue'
+
+# Queues without any push for this long are removed, along with the stale requests they may contain
+QUEUE_TTL_SECONDS = 60 * 60
+
+# KEYS[1]: the matching queue, KEYS[2]: the queue of the searcher
+# ARGV[1]: the id of the searcher, ARGV[2]: its score, ARGV[3]: the TTL of the queues
+# The searcher may be in the matching queue if its stance is the one it desires, hence the first two candidates
+POP_OR_PUSH_SCRIPT = """
+local candidates = redis.call('ZRANGE', KEYS[1], 0, 1)
+for _, candidate in ipairs(candidates) do
+    if candidate ~= ARGV[1] then
+        redis.call('ZREM', KEYS[1], candidate)
+        return candidate
+    end
+end
+redis.call('ZADD', KEYS[2], 'NX', ARGV[2], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return false
+"""
+
+
+@cache
+def get_redis_client():
+    return redis.Redis.from_url(settings.REDIS_URL)
+
+
+@cache
+def get_pop_or_push_script():
+    return get_redis_client().register_script(POP_OR_PUSH_SCRIPT)
+
+
+def get_queue_key(debate_id, stance, desired_stance):
+    """
+    Get the key of the queue of the requests made by users with the given stance who want to debate someone with the
+    desired stance.
+    """
+    return f'{QUEUE_KEY_PREFIX}:{debate_id}:{int(stance)}:{int(desired_stance)}'
+
+
+def pop_or_push(request_id, debate_id, stance, desired_stance, score):
+    """
+    Pop the oldest request matching the given request or, if there is none, push the given request in its own queue.
+
+    :param request_id: The id of the searching request
+    :param debate_id: The id of the debate of the request
+    :param stance: The stance of the user of the request on the debate
+    :param desired_stance: The stance the user of the request wants to debate against
+    :param score: The position of the request in its queue, lower is older (e.g. a timestamp)
+    :return: The id of the popped request or None if the request was pushed
+    """
+    candidate_id = get_pop_or_push_script()(
+        keys=[get_queue_key(debate_id, desired_stance, stance), get_queue_key(debate_id, stance, desired_stance)],
+        args=[request_id, score, QUEUE_TTL_SECONDS],
+    )
+    return int(candidate_id) if candidate_id is not None else None
+
+
+def push(request_id, debate_id, stance, desired_stance, score):
+    """
+    Push the request in its queue, e.g. to put back a request that was popped but could not be matched.
+    See pop_or_push for the parameters.
+    """
+    queue_key = get_queue_key(debate_id, stance, desired_stance)
+    pipeline = get_redis_client().pipeline()
+    pipeline.zadd(queue_key, {request_id: score}, nx=True)
+    pipeline.expire(queue_key, QUEUE_TTL_SECONDS)
+    pipeline.execute()
+
+
+def remove(request_id, debate_id, desired_stance):
+    """
+    Remove the request from the queues. Since the stance of the user may have changed, it is removed from both.
+    """
+    get_redis_client().zrem(get_queue_key(debate_id, True, desired_stance), request_id)
+    get_redis_client().zrem(get_queue_key(debate_id, False, desired_stance), request_id)
@@ -1,14 +1,19 @@
+from ProjectOpenDebate.common.badges import set_lazy_badge
 from pairing.models import PairingRequest
 
 
 class PairingMiddleware:
-    """Adds current_pairing_request to request if user is authenticated and has an active or idle pairing request."""
+    """
+    Adds current_pairing_request to request if user is authenticated and has an active or idle pairing request.
+    The value is only computed if it is used.
+    """
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
         if request.user.is_authenticated:
-            request.user.current_pairing_request = PairingRequest.objects.get_current_request(request.user)
+            user = request.user
+            set_lazy_badge(request, 'current_pairing_request', lambda: PairingRequest.objects.get_current_request(user))
 
         response = self.get_response(request)
 
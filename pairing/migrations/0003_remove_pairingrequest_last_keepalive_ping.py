@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:59
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pairing', '0002_alter_pairingmatch_related_discussion'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='pairingrequest',
+            name='last_keepalive_ping',
+        ),
+    ]
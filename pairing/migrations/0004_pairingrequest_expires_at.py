@@ -0,0 +1,42 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.timezone import now
+
+
+def backfill_expires_at(apps, schema_editor):
+    """The existing active requests are due right away, the sweeper extends the ones that are still alive."""
+    PairingRequest = apps.get_model('pairing', 'PairingRequest')
+    PairingRequest.objects.filter(status='active').update(expires_at=now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debate', '0011_comment_keyset_idx'),
+        ('pairing', '0003_remove_pairingrequest_last_keepalive_ping'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pairingrequest',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_expires_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='pairingrequest',
+            name='status',
+            field=models.CharField(choices=[('idle', 'Idle'), ('active', 'Active'), ('passive', 'Passive'), ('match_found', 'Match Found'), ('paired', 'Paired'), ('expired', 'Expired')], default='idle', max_length=25),
+        ),
+        migrations.AddIndex(
+            model_name='pairingrequest',
+            index=models.Index(condition=models.Q(('status__in', ['idle', 'active', 'match_found'])), fields=['user'], name='pairingrequest_current_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pairingrequest',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['expires_at'], name='pairingrequest_expiry_idx'),
+        ),
+    ]
@@ -1,34 +1,79 @@
+import logging
+
 from django.contrib.auth import get_user_model
-from django.db.models import F, Q, Subquery, OuterRef
+from django.db.models import F, Q, Subquery, OuterRef, Exists
+from django.utils.timezone import now
+from redis import RedisError
 
 from debate.models import Debate, Stance
-from django.db import models
+from django.db import models, transaction
 from datetime import datetime, timedelta, timezone
 from django.conf import settings
 
 from discussion.models import Discussion
 from discussion.views import create_discussion_and_readcheckpoints
+from . import matchmaking, presence
 
+logger = logging.getLogger(__name__)
 
-class PairingRequestManager(models.Manager):
-    def get_queryset(self):
-        return super().get_queryset().annotate(
-            is_expired=(
-                    Q(status=PairingRequest.Status.ACTIVE) &
-                    Q(last_keepalive_ping__lt=datetime.now() - timedelta(
-                        seconds=settings.PAIRING_REQUEST_EXPIRY_SECONDS))
-            )
-        )
 
-    def get_current_request(self, user, for_update=False):
+class PairingRequestManager(models.Manager):
+    def get_current_request(self, user, for_update=False, include_expired=False):
+        """
+        Get the current (idle, active or match found) pairing request of the user, or None.
+        This is a probe of the pairingrequest_current_idx index, the dead active requests being moved out of the
+        current statuses by sweep_expired. The ones that died since the last sweep are detected using their liveness
+        and skipped, so a request created after one of them is still found.
+
+        :param user: The user
+        :param for_update: Whether to lock the current requests of the user
+        :param include_expired: Whether to ignore the liveness of the requests, e.g. to mark the request alive again
+        """
         queryset = self.select_for_update() if for_update else self
-        return queryset.filter(
+        current_requests = queryset.filter(
             user=user,
-            status__in=(PairingRequest.Status.ACTIVE, PairingRequest.Status.IDLE, PairingRequest.Status.MATCH_FOUND),
-            is_expired=False
-        ).first()
+            status__in=PairingRequest.CURRENT_STATUSES,
+        ).order_by('-created_at')
+
+        for pairing_request in current_requests:
+            if include_expired or not pairing_request.is_expired:
+                return pairing_request
+
+        return None
+
+    def sweep_expired(self, batch_size=1000):
+        """
+        Check the liveness of the active requests whose expiry is due (see pairing.presence). The requests that are
+        still alive get a new expiry, the others are marked as expired.
+
+        The requests locked by another transaction (e.g. being matched) are skipped until the next sweep.
+
+        :param batch_size: The maximum number of requests checked per batch
+        :return: A tuple (number of extended requests, number of expired requests)
+        """
+        num_extended = num_expired = 0
+        while True:
+            with transaction.atomic():
+                due_requests = list(
+                    self.select_for_update(skip_locked=True).filter(
+                        status=PairingRequest.Status.ACTIVE,
+                        expires_at__lte=now()
+                    ).order_by('expires_at').values_list('id', 'user_id')[:batch_size]
+                )
+                if not due_requests:
+                    return num_extended, num_expired
+
+                alive_ids = presence.get_alive_request_ids([user_id for _, user_id in due_requests])
+                expired_ids = [request_id for request_id, _ in due_requests if request_id not in alive_ids]
+
+                num_extended += self.filter(id__in=alive_ids).update(expires_at=PairingRequest.get_next_expiry())
+                num_expired += self.filter(id__in=expired_ids).update(status=PairingRequest.Status.EXPIRED)
 
     def get_best_match(self, pairing_request, for_update=False):
+        """
+        Get a request matching the pairing request by scanning the pairing requests.
+        This is only used when Redis is unavailable (see get_queued_match), so the liveness of the match is not checked.
+        """
         queryset = self.select_for_update() if for_update else self
 
         # Other user stance subquery
@@ -46,9 +91,68 @@ class PairingRequestManager(models.Manager):
             status=pairing_request.status,
             desired_stance=pairing_request.debate.get_stance(pairing_request.user),
             other_user_stance=pairing_request.desired_stance,
-            is_expired=False
         ).exclude(user=pairing_request.user).first()
 
+    def get_queued_match(self, pairing_request):
+        """
+        Get the oldest active request matching the pairing request using the matchmaking queues (see
+        pairing.matchmaking), locked for update. If there is none, the pairing request is queued to be found by the next
+        matching searcher.
+
+        The pairing request must already be committed as active: once queued, it can be popped by a concurrent
+        searcher, who must see it as active.
+
+        The popped requests are validated since they may have been cancelled, may have expired or their user may have
+        changed their stance. The invalid ones are dropped.
+        If Redis is unavailable, this falls back to get_best_match.
+
+        :param pairing_request: The active pairing request looking for a match
+        :return: The matching PairingRequest or None
+        """
+        # Users without a stance cannot be matched, like in get_best_match
+        user_stance = pairing_request.debate.get_stance(pairing_request.user)
+        if user_stance is None:
+            return None
+
+        has_desired_stance = Exists(Stance.objects.filter(
+            debate_id=pairing_request.debate_id,
+            user=OuterRef('user'),
+            stance=pairing_request.desired_stance
+        ))
+
+        while True:
+            try:
+                candidate_id = matchmaking.pop_or_push(
+                    pairing_request.id,
+                    pairing_request.debate_id,
+                    user_stance,
+                    pairing_request.desired_stance,
+                    pairing_request.created_at.timestamp()
+                )
+            except RedisError as e:
+                logger.warning(f'Matchmaking queues unavailable, falling back to the database: {e}')
+                return self.get_best_match(pairing_request, for_update=True)
+
+            if candidate_id is None:
+                return None
+
+            # The candidate is locked by id only and validated afterwards: if a transaction is still changing it, this
+            # waits for its outcome instead of filtering out the version committed before it.
+            candidate = self.select_for_update(of=('self',)).annotate(
+                has_desired_stance=has_desired_stance
+            ).filter(id=candidate_id).first()
+
+            if (
+                    candidate
+                    and candidate.has_desired_stance
+                    and candidate.debate_id == pairing_request.debate_id
+                    and candidate.status == PairingRequest.Status.ACTIVE
+                    and candidate.desired_stance == user_stance
+                    and candidate.user_id != pairing_request.user_id
+                    and not candidate.is_expired
+            ):
+                return candidate
+
 
 class PairingRequest(models.Model):
     class Status(models.TextChoices):
@@ -57,35 +161,92 @@ class PairingRequest(models.Model):
         PASSIVE = 'passive'
         MATCH_FOUND = 'match_found'
         PAIRED = 'paired'
+        EXPIRED = 'expired'
+
+    # The statuses of the request a user is currently engaged in, a user has at most one request in these statuses
+    CURRENT_STATUSES = (Status.ACTIVE, Status.IDLE, Status.MATCH_FOUND)
 
     user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
     debate = models.ForeignKey(Debate, on_delete=models.CASCADE)
     desired_stance = models.BooleanField()  # True for "for", False for "against"
     status = models.CharField(max_length=25, choices=Status.choices, default=Status.IDLE)
-    last_keepalive_ping = models.DateTimeField(auto_now_add=True)  # doesn't update on save, must be updated manually
     created_at = models.DateTimeField(auto_now_add=True)
+    # When the liveness of an active request must be checked again by the sweeper
+    expires_at = models.DateTimeField(null=True, blank=True)
 
     objects = PairingRequestManager()
 
+    class Meta:
+        indexes = [
+            # To quickly get the current request of a user
+            models.Index(fields=['user'], condition=Q(status__in=['idle', 'active', 'match_found']),
+                         name='pairingrequest_current_idx'),
+            # To quickly get the active requests to sweep
+            models.Index(fields=['expires_at'], condition=Q(status='active'), name='pairingrequest_expiry_idx'),
+        ]
+
+    @staticmethod
+    def get_next_expiry():
+        return now() + timedelta(seconds=settings.PAIRING_REQUEST_EXPIRY_SECONDS)
+
     @property
     def seconds_elapsed_since_creation(self):
         return round((datetime.now(timezone.utc) - self.created_at).total_seconds())
 
-    def update_keepalive(self):
+    @property
+    def is_expired(self):
+        """
+        Whether the request is active but its client stopped sending keepalives (see pairing.presence).
+        If Redis is unavailable, the request is considered alive.
+        """
+        if self.status != PairingRequest.Status.ACTIVE:
+            return False
+
+        try:
+            return not presence.is_alive(self.user_id, self.id)
+        except RedisError as e:
+            logger.warning(f'Could not check the liveness of {self}: {e}')
+            return False
+
+    def mark_alive(self):
+        """
+        Marks the request as alive for the next settings.PAIRING_REQUEST_EXPIRY_SECONDS seconds.
+        The client then keeps it alive by sending a keepalive every settings.PAIRING_KEEPALIVE_INTERVAL seconds.
         """
-        Updates the last_keepalive_ping field to the current time.
+        try:
+            presence.mark_alive(self.user_id, self.id)
+        except RedisError as e:
+            logger.warning(f'Could not mark {self} as alive: {e}')
 
-        This should be called by the client every settings.PAIRING_KEEPALIVE_INTERVAL seconds
-        to keep the PairingRequest active.
+    def requeue(self, stance):
         """
-        self.last_keepalive_ping = datetime.now()
-        self.save()
+        Put the request back in the matchmaking queues, at its original position.
+        This is needed when it was popped by a searcher who could not complete the match (e.g. the transaction failed).
+
+        :param stance: The stance of the user of the request
+        """
+        try:
+            matchmaking.push(self.id, self.debate_id, stance, self.desired_stance, self.created_at.timestamp())
+        except RedisError as e:
+            logger.warning(f'Could not requeue {self}: {e}')
+
+    def remove_from_queues(self):
+        """
+        Removes the request from the matchmaking queues. If this fails, the request is dropped once popped anyway.
+        """
+        try:
+            matchmaking.remove(self.id, self.debate_id, self.desired_stance)
+        except RedisError as e:
+            logger.warning(f'Could not remove {self} from the matchmaking queues: {e}')
 
     def switch_status(self, new_status: Status):
         """
         Switches the status of the PairingRequest to the new_status.
+        The active requests expire if their client stops sending keepalives, see sweep_expired.
         """
         self.status = new_status
+        if new_status == PairingRequest.Status.ACTIVE:
+            self.expires_at = PairingRequest.get_next_expiry()
         self.save()
 
     def __str__(self):
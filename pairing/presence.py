@@ -0,0 +1,51 @@
+"""
+Liveness of the pairing requests.
+
+The clients of the pairing requests send a keepalive every PAIRING_KEEPALIVE_INTERVAL seconds. Instead of writing the
+time of the last keepalive to the database, each keepalive extends the TTL of a Redis key holding the id of the current
+request of the user. An active request whose key has expired is expired, so the database only sees state transitions.
+"""
+from django.conf import settings
+
+from .matchmaking import get_redis_client
+
+PRESENCE_KEY_PREFIX = 'opendebate:pairing:presence'
+
+
+def get_presence_key(user_id):
+    return f'{PRESENCE_KEY_PREFIX}:{user_id}'
+
+
+def mark_alive(user_id, request_id):
+    """
+    Mark the request as the live request of the user for the next PAIRING_REQUEST_EXPIRY_SECONDS seconds.
+    """
+    get_redis_client().set(get_presence_key(user_id), request_id, ex=settings.PAIRING_REQUEST_EXPIRY_SECONDS)
+
+
+def refresh(user_id):
+    """
+    Extend the liveness of the current request of the user, without knowing which request it is.
+
+    :return: False if the user has no live request (e.g. it expired), in which case nothing is extended
+    """
+    return bool(get_redis_client().expire(get_presence_key(user_id), settings.PAIRING_REQUEST_EXPIRY_SECONDS))
+
+
+def is_alive(user_id, request_id):
+    return get_redis_client().get(get_presence_key(user_id)) == str(request_id).encode()
+
+
+def get_alive_request_ids(user_ids):
+    """
+    Get the ids of the live requests of the users, in a single round trip.
+
+    :param user_ids: A list of user ids
+    :return: A set of request ids
+    """
+    if not user_ids:
+        return set()
+
+    values = get_redis_client().mget([get_presence_key(user_id) for user_id in user_ids])
+    return {int(value) for value in values if value is not None}
+
@@ -1,123 +1,213 @@
-from celery import shared_task
+import heapq
+import time
+import uuid
+from functools import cache
+
+from celery import chord, group, shared_task
 from celery.utils.log import get_task_logger
+from django.conf import settings
 from django.db import transaction
-from django.db.models import OuterRef, Subquery
+from django.db.models import Count, OuterRef, Subquery, prefetch_related_objects
 
+from ProjectOpenDebate.common.publishing import publish_many
 from debate.models import Stance
+from discussion.models import Discussion, ReadCheckpoint
 from notifications.models import Notification
+from .matchmaking import get_redis_client
 from .models import PairingRequest, PairingMatch
 from datetime import timedelta, datetime
 
-from collections import deque
+from collections import defaultdict, deque
 
 logger = get_task_logger(__name__)
 GRACE_PERIOD = timedelta(minutes=5)
+PASSIVE_PAIRING_LOCK_KEY = 'opendebate:pairing:passive_pairing_lock'
+
+# KEYS[1]: the lock, ARGV[1]: the token of the run releasing it
+# The lock is only deleted if it still holds the token, in a single atomic step: it may have timed out and been taken
+# by another run in the meantime
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def match_passive_requests(requests):
+    """
+    Pairs the passive requests, in memory. Each request is matched with the oldest unmatched request of the same debate
+    whose user has the stance it desires and desires the stance of its user.
+
+    :param requests: The requests, sorted by creation time and annotated with the stance of their user (user_stance).
+        The requests whose user has no stance on the debate cannot be matched.
+    :return: A list of (request, matching request) tuples
+    """
+    # The queues of unmatched requests, per (debate, stance of the user, desired stance)
+    unmatched_requests = defaultdict(deque)
+
+    pairs = []
+    for request in requests:
+        if request.user_stance is None:
+            continue
+
+        # A matching request is from a user with the desired stance who wants to debate someone with our stance
+        matching_queue = unmatched_requests[(request.debate_id, request.desired_stance, request.user_stance)]
+
+        if matching_queue and matching_queue[0].user_id != request.user_id:
+            # Match with the oldest one (first in the queue)
+            pairs.append((request, matching_queue.popleft()))
+        else:
+            # Wait in our own queue for a matching request
+            unmatched_requests[(request.debate_id, request.user_stance, request.desired_stance)].append(request)
+
+    return pairs
 
 
-@transaction.atomic
-def create_match(pairing_request, other_pairing_request):
+def create_matches_in_bulk(pairs):
     """
-    Creates a PairingMatch between the two pairing requests.
-    It also creates the related discussion and the notifications for the participants.
+    Creates the PairingMatch of each pair of requests, along with the related discussion, its read checkpoints and the
+    notifications of the participants, with a few bulk queries whatever the number of pairs.
+    The participants are notified (discussion list and notifications) once the transaction is committed.
+
+    Unlike PairingMatch.complete_match, this does not call save() on the requests, so the pairs should be locked.
 
-    returns the PairingMatch object.
+    :param pairs: A list of (request, matching request) tuples, with their user and debate selected
+    :return: The created PairingMatch instances
     """
-    pairing_match = PairingMatch.objects.create(
-        pairing_request_1=pairing_request,
-        pairing_request_2=other_pairing_request
+    if not pairs:
+        return []
+
+    PairingRequest.objects.filter(
+        id__in=[request.id for pair in pairs for request in pair]
+    ).update(status=PairingRequest.Status.PAIRED)
+
+    discussions = Discussion.objects.bulk_create(
+        Discussion(debate=request.debate, participant1=request.user, participant2=other_request.user)
+        for request, other_request in pairs
     )
 
-    # Complete the match
-    related_discussion = pairing_match.complete_match()
+    ReadCheckpoint.objects.bulk_create(
+        ReadCheckpoint(discussion=discussion, user_id=user_id)
+        for discussion in discussions
+        for user_id in (discussion.participant1_id, discussion.participant2_id)
+    )
+
+    pairing_matches = PairingMatch.objects.bulk_create(
+        PairingMatch(pairing_request_1=request, pairing_request_2=other_request, related_discussion=discussion)
+        for (request, other_request), discussion in zip(pairs, discussions)
+    )
 
     # If any of the participants is online, we will add the discussion to their list of discussions live
-    related_discussion.add_discussion_to_participants_list_live()
+    # The discussions are not from invites, the prefetch just avoids a query per discussion to know it
+    prefetch_related_objects(discussions, 'inviteuse')
+    events = []
+    for discussion in discussions:
+        events.extend(discussion.get_new_discussion_events())
+    publish_many(events)
 
     # Send the notification to the participants
-    Notification.objects.create_new_discussion_notification(
-        pairing_request.user_id,
-        other_pairing_request.user.username,
-        related_discussion.id,
-        related_discussion.debate.title
-    )
-    Notification.objects.create_new_discussion_notification(
-        other_pairing_request.user_id,
-        pairing_request.user.username,
-        related_discussion.id,
-        related_discussion.debate.title
-    )
+    Notification.objects.create_in_bulk([
+        Notification.objects.build_new_discussion_notification(
+            user_to_notify.id,
+            other_user.username,
+            discussion.id,
+            request.debate.title
+        )
+        for (request, other_request), discussion in zip(pairs, discussions)
+        for user_to_notify, other_user in [(request.user, other_request.user), (other_request.user, request.user)]
+    ])
 
-    return pairing_match
+    return pairing_matches
 
 
-@transaction.atomic
-def try_pairing_passive_requests_in_debate(locked_requests):
+def create_matches(pairs):
     """
-    Tries to pair passive pairing requests for a given debate.
-    This function assumes that the requests are already sorted by the time they were created.
-    You should also lock the requests before calling this function to prevent race conditions.
+    Creates the matches of the pairs in bulk (see create_matches_in_bulk). If that fails, the pairs are created one by
+    one, each in its own savepoint, so that a failing pair does not prevent the others from being matched. The
+    requests of the failing pairs are left untouched and will be paired again by the next run.
+
+    :param pairs: A list of (request, matching request) tuples, see create_matches_in_bulk
+    :return: A tuple (created PairingMatch instances, number of failed pairs)
     """
-    unmatched_requests = {
-        'wants_for': {
-            'is_for': deque(),
-            'is_against': deque()
-        },
-        'wants_against': {
-            'is_for': deque(),
-            'is_against': deque()
-        }
-    }
+    try:
+        with transaction.atomic():
+            return create_matches_in_bulk(pairs), 0
+    except Exception as e:  # noqa
+        logger.warning(f'Error creating {len(pairs)} matches in bulk, creating them one by one: {e}')
 
     pairing_matches = []
-    for request in locked_requests:
-        # Determine where the matching queue is.
-        # The user of the current request wants to debate someone who is_for or is_against
-        # A matching request would wants_for or wants_against
-        matching_queue_stance = 'is_for' if request.desired_stance else 'is_against'
-        matching_queue_desire = 'wants_for' if request.user_stance else 'wants_against'
-
-        # Get the queue of unmatched requests that would match with this request
-        matching_queue = unmatched_requests[matching_queue_desire][matching_queue_stance]
-
-        if not matching_queue:
-            # If there are no requests in the queue, we need to add this request in its own queue
-            request_stance = 'is_for' if request.user_stance else 'is_against'
-            request_desire = 'wants_for' if request.desired_stance else 'wants_against'
-            request_queue = unmatched_requests[request_desire][request_stance]
-            request_queue.append(request)
-        else:
-            # If there are requests in the queue, we can match with the oldest one (first in the queue)
-            oldest_matching_request = matching_queue.popleft()
-            try:
-                pairing_match = create_match(request, oldest_matching_request)
-            except Exception as e:  # noqa
-                # If the match fails, we need to put the oldest_matching_request back in the queue
-                # TODO: log the error
-                logger.error(f'Error creating match: {e}')
-                matching_queue.appendleft(oldest_matching_request)
-            else:
-                pairing_matches.append(pairing_match)
+    num_failed = 0
+    for request, other_request in pairs:
+        try:
+            with transaction.atomic():
+                pairing_matches.extend(create_matches_in_bulk([(request, other_request)]))
+        except Exception as e:  # noqa
+            logger.error(f'Error creating match between requests {request.id} and {other_request.id}: {e}')
+            num_failed += 1
 
-    return pairing_matches
+    return pairing_matches, num_failed
 
 
 @shared_task
-def try_pairing_passive_requests():
+def sweep_expired_pairing_requests():
     """
-    Attempts to pair passive pairing requests for all debates.
+    Marks the active pairing requests whose client stopped sending keepalives as expired.
+    """
+    num_extended, num_expired = PairingRequest.objects.sweep_expired()
+    if num_extended or num_expired:
+        logger.info(f'Swept pairing requests: {num_extended} still alive, {num_expired} expired')
 
-    To give enough time for each request to be matched with high quality matches, it only considers
-    pairing requests that have been created at least 5 minutes ago.
 
-    TODO: ensure the whole thing doesnt fail if a single pairing match fails
+def get_passive_requests_to_pair(debate_ids=None):
     """
-    logger.info('Trying to pair passive requests')
+    Get the passive pairing requests that are at least GRACE_PERIOD old, giving them enough time to be matched with
+    high quality matches.
 
-    # Get all debates with passive pairing requests that are at least 5 minutes old
-    debates = PairingRequest.objects.filter(
+    :param debate_ids: If given, only the requests of these debates
+    """
+    requests = PairingRequest.objects.filter(
         status=PairingRequest.Status.PASSIVE,
         created_at__lte=datetime.now() - GRACE_PERIOD
-    ).values_list('debate', 'debate__title').distinct()
+    )
+    if debate_ids is not None:
+        requests = requests.filter(debate_id__in=debate_ids)
+
+    return requests
+
+
+def shard_debates(num_requests_per_debate, num_shards):
+    """
+    Splits the debates into shards with about the same number of requests to pair, so that a busy debate does not
+    delay the others. The busiest debates are assigned first, each to the least loaded shard.
+
+    :param num_requests_per_debate: A list of (debate_id, number of requests) tuples
+    :param num_shards: The maximum number of shards
+    :return: A list of lists of debate ids
+    """
+    num_shards = min(num_shards, len(num_requests_per_debate))
+    shards = [(0, shard_index, []) for shard_index in range(num_shards)]  # (load, index, debate ids), as a heap
+
+    for debate_id, num_requests in sorted(num_requests_per_debate, key=lambda item: item[1], reverse=True):
+        load, shard_index, debate_ids = heapq.heappop(shards)
+        debate_ids.append(debate_id)
+        heapq.heappush(shards, (load + num_requests, shard_index, debate_ids))
+
+    return [debate_ids for _, _, debate_ids in shards]
+
+
+@shared_task
+def try_pairing_passive_requests_in_debates(debate_ids):
+    """
+    Attempts to pair the passive pairing requests of the given debates.
+
+    All the requests are fetched and locked with a single query, paired in memory and the matches are created with
+    bulk queries, in a single transaction. The requests locked by another transaction are skipped until the next run.
+    A pair whose match cannot be created is skipped as well, see create_matches.
+
+    :return: The statistics of the run, aggregated by finish_pairing_passive_requests
+    """
+    start = time.perf_counter()
 
     # Define the user_stance subquery
     user_stance = Subquery(
@@ -127,28 +217,123 @@ def try_pairing_passive_requests():
         ).values('stance')[:1]
     )
 
-    logger.info(f'Found {len(debates)} debates with passive requests')
+    with transaction.atomic():
+        requests = list(
+            get_passive_requests_to_pair(debate_ids).select_for_update(
+                of=('self',), skip_locked=True
+            ).annotate(
+                user_stance=user_stance
+            ).select_related('user', 'debate').order_by('created_at')
+        )
+        fetched = time.perf_counter()
 
-    for debate_id, debate_title in debates:
-        logger.info(f'Pairing requests for debate {debate_id} ({debate_title})')
+        pairs = match_passive_requests(requests)
+        matched = time.perf_counter()
 
-        # Get all passive pairing requests for this debate
-        requests = PairingRequest.objects.select_for_update(
-            of=('self',)
-        ).filter(
-            debate=debate_id,
-            status=PairingRequest.Status.PASSIVE,
-            created_at__lte=datetime.now() - GRACE_PERIOD
-        ).annotate(
-            user_stance=user_stance
-        ).order_by('created_at')
+        pairing_matches, num_failed = create_matches(pairs)
+    created = time.perf_counter()
 
-        try:
-            pairing_matches = try_pairing_passive_requests_in_debate(requests)
-        except Exception as e:  # noqa
-            # If the pairing fails, we need to log the error
-            logger.error(f'Error pairing requests (debate {debate_id}): {e}')
-            continue
+    stats = {
+        'num_debates': len(debate_ids),
+        'num_requests': len(requests),
+        'num_paired': 2 * len(pairing_matches),
+        'num_failed': num_failed,
+        'fetch_ms': (fetched - start) * 1000,
+        'match_ms': (matched - fetched) * 1000,
+        'create_ms': (created - matched) * 1000,
+    }
+    logger.info(
+        f'Paired {stats["num_paired"]} of {stats["num_requests"]} passive requests in {len(debate_ids)} debates in '
+        f'{(created - start) * 1000:.1f}ms (fetch {stats["fetch_ms"]:.1f}ms, match {stats["match_ms"]:.1f}ms, '
+        f'create {stats["create_ms"]:.1f}ms), {num_failed} pairs failed'
+    )
+
+    return stats
+
+
+@shared_task
+def finish_pairing_passive_requests(shard_stats, lock_token, started_at):
+    """
+    Logs the statistics of a passive pairing run and releases its lock, see try_pairing_passive_requests.
+    """
+    elapsed_ms = (time.time() - started_at) * 1000
+    slowest_shard_ms = max(stats["fetch_ms"] + stats["match_ms"] + stats["create_ms"] for stats in shard_stats)
+    logger.info(
+        f'Passive pairing run done in {elapsed_ms:.1f}ms: paired {sum(stats["num_paired"] for stats in shard_stats)} '
+        f'of {sum(stats["num_requests"] for stats in shard_stats)} requests in {len(shard_stats)} shards, '
+        f'{sum(stats["num_failed"] for stats in shard_stats)} pairs failed (slowest shard: {slowest_shard_ms:.1f}ms)'
+    )
+    release_passive_pairing_lock(lock_token)
+
+
+@cache
+def get_release_lock_script():
+    return get_redis_client().register_script(RELEASE_LOCK_SCRIPT)
+
+
+def acquire_passive_pairing_lock(lock_token):
+    """
+    Take the lock of the passive pairing runs for PAIRING_PASSIVE_LOCK_TIMEOUT seconds, unless another run holds it.
+
+    :param lock_token: A token unique to the run, needed to release the lock
+    :return: Whether the lock was taken
+    """
+    return bool(get_redis_client().set(
+        PASSIVE_PAIRING_LOCK_KEY, lock_token, nx=True, ex=settings.PAIRING_PASSIVE_LOCK_TIMEOUT
+    ))
+
+
+def release_passive_pairing_lock(lock_token):
+    """
+    Release the lock of the passive pairing runs if it is still held by the run with the given token.
+    """
+    get_release_lock_script()(keys=[PASSIVE_PAIRING_LOCK_KEY], args=[lock_token])
+
+
+@shared_task
+def fail_pairing_passive_requests(lock_token):
+    """
+    Releases the lock of a passive pairing run whose chord failed (e.g. a shard raised), so that the next run is not
+    delayed until the lock times out. See try_pairing_passive_requests.
+    """
+    logger.error('Passive pairing run failed, releasing its lock')
+    release_passive_pairing_lock(lock_token)
+
+
+@shared_task
+def try_pairing_passive_requests():
+    """
+    Attempts to pair passive pairing requests for all debates.
+
+    The debates with requests to pair are split into shards (see shard_debates) paired concurrently by the workers,
+    using a chord whose callback releases the lock of the run. A run is skipped if the previous one is still in
+    progress, so the runs never overlap. If the chord fails, its error callback releases the lock. The lock also times
+    out after PAIRING_PASSIVE_LOCK_TIMEOUT in case a run never completes (e.g. a worker was killed).
+    """
+    lock_token = uuid.uuid4().hex
+    if not acquire_passive_pairing_lock(lock_token):
+        logger.info('Skipping passive pairing, the previous run is still in progress')
+        return
+
+    try:
+        num_requests_per_debate = list(
+            get_passive_requests_to_pair().order_by().values('debate').annotate(num_requests=Count('id')).values_list(
+                'debate', 'num_requests'
+            )
+        )
+        if not num_requests_per_debate:
+            release_passive_pairing_lock(lock_token)
+            return
+
+        shards = shard_debates(num_requests_per_debate, settings.PAIRING_PASSIVE_NUM_SHARDS)
+        logger.info(f'Pairing passive requests of {len(num_requests_per_debate)} debates in {len(shards)} shards')
 
-        logger.info(
-            f'Paired {2 * len(pairing_matches)} requests in debate {debate_id}. There are now {len(requests) - 2 * len(pairing_matches)} requests left.')
+        chord(
+            group(try_pairing_passive_requests_in_debates.s(debate_ids) for debate_ids in shards),
+            finish_pairing_passive_requests.s(lock_token, time.time()).on_error(
+                fail_pairing_passive_requests.si(lock_token)
+            )
+        ).delay()
+    except Exception:
+        release_passive_pairing_lock(lock_token)
+        raise
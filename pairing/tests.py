@@ -1,3 +1,275 @@
-from django.test import TestCase
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from threading import Barrier
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils.timezone import now
+
+from debate.models import Debate
+from notifications.models import NotificationType
+from . import matchmaking, presence, tasks
+from .consumers import PairingConsumer
+from .models import PairingMatch, PairingRequest
+from .tasks import (
+    PASSIVE_PAIRING_LOCK_KEY, acquire_passive_pairing_lock, create_matches, fail_pairing_passive_requests,
+    finish_pairing_passive_requests, match_passive_requests, shard_debates
+)
+
+
+class ConcurrentSearchTests(TransactionTestCase):
+    def setUp(self):
+        self.debate = Debate.objects.create(title='Concurrent searches', description='Test')
+        # Remove the requests left in the queues of this debate by a previous run
+        for stance in (True, False):
+            for desired_stance in (True, False):
+                matchmaking.get_redis_client().delete(matchmaking.get_queue_key(self.debate.id, stance, desired_stance))
+
+        self.users = []
+        for username, stance in (('for', True), ('against', False)):
+            user = get_user_model().objects.create_user(username=username, password='password')
+            self.debate.set_stance(user, stance)
+            PairingRequest.objects.create(user=user, debate=self.debate, desired_stance=not stance).mark_alive()
+            self.users.append(user)
+
+    def start_search(self, user, barrier):
+        """Starts the search of the user from a worker thread, which uses its own database connection."""
+        try:
+            barrier.wait()
+            return async_to_sync(PairingConsumer().create_pairing_match_or_fail)(user)
+        finally:
+            connection.close()
+
+    def test_simultaneous_searchers_are_matched(self):
+        barrier = Barrier(len(self.users))
+
+        with ThreadPoolExecutor(max_workers=len(self.users)) as executor:
+            results = list(executor.map(self.start_search, self.users, [barrier] * len(self.users)))
+
+        self.assertEqual(sum(pairing_match is not None for _, _, pairing_match in results), 1)
+        self.assertEqual(PairingMatch.objects.count(), 1)
+        self.assertFalse(PairingRequest.objects.exclude(status=PairingRequest.Status.MATCH_FOUND).exists())
+
+
+class ShardDebatesTests(SimpleTestCase):
+    def test_shards_are_balanced(self):
+        num_requests_per_debate = [(1, 10), (2, 7), (3, 5), (4, 5), (5, 2), (6, 1)]
+
+        shards = shard_debates(num_requests_per_debate, 3)
+
+        num_requests = dict(num_requests_per_debate)
+        self.assertEqual(sorted(debate_id for shard in shards for debate_id in shard), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(sorted(sum(num_requests[debate_id] for debate_id in shard) for shard in shards), [10, 10, 10])
+
+    def test_no_more_shards_than_debates(self):
+        self.assertEqual(sorted(shard_debates([(1, 3), (2, 1)], 8)), [[1], [2]])
+
+
+class PassivePairingLockTests(SimpleTestCase):
+    SHARD_STATS = [{'num_paired': 2, 'num_requests': 3, 'num_failed': 0, 'fetch_ms': 1, 'match_ms': 1, 'create_ms': 1}]
+
+    def setUp(self):
+        matchmaking.get_redis_client().delete(PASSIVE_PAIRING_LOCK_KEY)
+        self.lock_token = uuid.uuid4().hex
+        self.assertTrue(acquire_passive_pairing_lock(self.lock_token))
+
+    def tearDown(self):
+        matchmaking.get_redis_client().delete(PASSIVE_PAIRING_LOCK_KEY)
+
+    def test_lock_is_exclusive(self):
+        self.assertFalse(acquire_passive_pairing_lock(uuid.uuid4().hex))
+
+    def test_chord_callback_releases_the_lock(self):
+        finish_pairing_passive_requests(self.SHARD_STATS, self.lock_token, time.time())
+
+        self.assertTrue(acquire_passive_pairing_lock(uuid.uuid4().hex))
+
+    def test_chord_error_callback_releases_the_lock(self):
+        fail_pairing_passive_requests(self.lock_token)
+
+        self.assertTrue(acquire_passive_pairing_lock(uuid.uuid4().hex))
+
+    def test_lock_taken_by_another_run_is_not_released(self):
+        # The lock of this run timed out and was taken by the next run
+        matchmaking.get_redis_client().delete(PASSIVE_PAIRING_LOCK_KEY)
+        next_lock_token = uuid.uuid4().hex
+        self.assertTrue(acquire_passive_pairing_lock(next_lock_token))
+
+        finish_pairing_passive_requests(self.SHARD_STATS, self.lock_token, time.time())
+
+        self.assertEqual(matchmaking.get_redis_client().get(PASSIVE_PAIRING_LOCK_KEY), next_lock_token.encode())
+
+
+class MatchPassiveRequestsTests(SimpleTestCase):
+    def make_request(self, request_id, user_id, user_stance, desired_stance, debate_id=1):
+        return SimpleNamespace(
+            id=request_id, user_id=user_id, debate_id=debate_id, user_stance=user_stance, desired_stance=desired_stance
+        )
+
+    def get_pair_ids(self, pairs):
+        return [(request.id, other_request.id) for request, other_request in pairs]
+
+    def test_oldest_matching_request_is_matched_first(self):
+        requests = [
+            self.make_request(1, user_id=1, user_stance=True, desired_stance=False),
+            self.make_request(2, user_id=2, user_stance=True, desired_stance=False),
+            self.make_request(3, user_id=3, user_stance=False, desired_stance=True),
+            self.make_request(4, user_id=4, user_stance=False, desired_stance=True),
+            self.make_request(5, user_id=5, user_stance=False, desired_stance=True),
+        ]
+
+        self.assertEqual(self.get_pair_ids(match_passive_requests(requests)), [(3, 1), (4, 2)])
+
+    def test_queues_are_per_debate_and_stances(self):
+        requests = [
+            self.make_request(1, user_id=1, user_stance=True, desired_stance=False, debate_id=1),
+            self.make_request(2, user_id=2, user_stance=False, desired_stance=True, debate_id=2),
+            self.make_request(3, user_id=3, user_stance=False, desired_stance=False, debate_id=1),
+            self.make_request(4, user_id=4, user_stance=True, desired_stance=True, debate_id=1),
+            self.make_request(5, user_id=5, user_stance=True, desired_stance=True, debate_id=1),
+        ]
+
+        self.assertEqual(self.get_pair_ids(match_passive_requests(requests)), [(5, 4)])
+
+    def test_requests_without_stance_are_skipped(self):
+        requests = [
+            self.make_request(1, user_id=1, user_stance=None, desired_stance=False),
+            self.make_request(2, user_id=2, user_stance=False, desired_stance=True),
+            self.make_request(3, user_id=3, user_stance=True, desired_stance=False),
+        ]
+
+        self.assertEqual(self.get_pair_ids(match_passive_requests(requests)), [(3, 2)])
+
+    def test_requests_of_the_same_user_are_not_matched(self):
+        requests = [
+            self.make_request(1, user_id=1, user_stance=True, desired_stance=True),
+            self.make_request(2, user_id=1, user_stance=True, desired_stance=True),
+            self.make_request(3, user_id=2, user_stance=True, desired_stance=True),
+        ]
+
+        self.assertEqual(self.get_pair_ids(match_passive_requests(requests)), [(3, 1)])
+
+
+class CreateMatchesTests(TestCase):
+    def setUp(self):
+        NotificationType.objects.create(
+            name='new_discussion',
+            title_template='New discussion',
+            message_template='{participant_username} wants to discuss "{debate_title}" with you.'
+        )
+        self.debate = Debate.objects.create(title='Passive pairing', description='Test')
+
+        self.pairs = []
+        for i in range(3):
+            pair = []
+            for stance in (True, False):
+                user = get_user_model().objects.create_user(username=f'passive {i} {stance}', password='password')
+                self.debate.set_stance(user, stance)
+                pair.append(PairingRequest.objects.create(
+                    user=user, debate=self.debate, desired_stance=not stance, status=PairingRequest.Status.PASSIVE
+                ))
+            self.pairs.append(tuple(pair))
+
+    def test_failing_pair_does_not_prevent_the_others(self):
+        failing_pair = self.pairs[1]
+        create_matches_in_bulk = tasks.create_matches_in_bulk
+
+        def fail_on_failing_pair(pairs):
+            pairing_matches = create_matches_in_bulk(pairs)
+            if failing_pair in pairs:
+                raise RuntimeError('Failing pair')
+            return pairing_matches
+
+        with mock.patch.object(tasks, 'create_matches_in_bulk', side_effect=fail_on_failing_pair):
+            pairing_matches, num_failed = create_matches(self.pairs)
+
+        self.assertEqual(num_failed, 1)
+        self.assertEqual(len(pairing_matches), 2)
+        self.assertEqual(PairingMatch.objects.count(), 2)
+        for pair in self.pairs:
+            expected_status = PairingRequest.Status.PASSIVE if pair is failing_pair else PairingRequest.Status.PAIRED
+            for request in pair:
+                request.refresh_from_db(fields=['status'])
+                self.assertEqual(request.status, expected_status)
+
+
+class CurrentRequestTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='searcher', password='password')
+        self.debate = Debate.objects.create(title='Current requests', description='Test')
+        matchmaking.get_redis_client().delete(presence.get_presence_key(self.user.id))
+
+    def tearDown(self):
+        matchmaking.get_redis_client().delete(presence.get_presence_key(self.user.id))
+
+    def create_request(self, status):
+        return PairingRequest.objects.create(
+            user=self.user, debate=self.debate, desired_stance=True, status=status, expires_at=now()
+        )
+
+    def test_expired_active_request_is_skipped(self):
+        self.create_request(PairingRequest.Status.ACTIVE)  # its client is gone, but it was not swept yet
+        newer_request = self.create_request(PairingRequest.Status.IDLE)
+        newer_request.mark_alive()
+
+        self.assertEqual(PairingRequest.objects.get_current_request(self.user), newer_request)
+
+    def test_expired_active_request_is_only_returned_when_included(self):
+        expired_request = self.create_request(PairingRequest.Status.ACTIVE)
+
+        self.assertIsNone(PairingRequest.objects.get_current_request(self.user))
+        self.assertEqual(PairingRequest.objects.get_current_request(self.user, include_expired=True), expired_request)
+
+    def test_keepalive_marks_the_request_alive_again(self):
+        # The presence key of the request was lost (e.g. Redis restarted) but its client is still there
+        pairing_request = self.create_request(PairingRequest.Status.ACTIVE)
+        consumer = PairingConsumer()
+        consumer.send_json = mock.AsyncMock()
+
+        async_to_sync(consumer.keepalive)(self.user)
+
+        self.assertTrue(presence.is_alive(self.user.id, pairing_request.id))
+        consumer.send_json.assert_awaited_once_with({'status': 'success', 'event_type': 'keepalive_ack'})
+
+
+class SweepExpiredTests(TestCase):
+    def setUp(self):
+        self.debate = Debate.objects.create(title='Expired requests', description='Test')
+        self.users = [
+            get_user_model().objects.create_user(username=f'swept {i}', password='password') for i in range(3)
+        ]
+        matchmaking.get_redis_client().delete(*(presence.get_presence_key(user.id) for user in self.users))
+
+    def tearDown(self):
+        matchmaking.get_redis_client().delete(*(presence.get_presence_key(user.id) for user in self.users))
+
+    def create_active_request(self, user, expires_at):
+        return PairingRequest.objects.create(
+            user=user, debate=self.debate, desired_stance=True, status=PairingRequest.Status.ACTIVE,
+            expires_at=expires_at
+        )
+
+    def test_alive_requests_are_extended_and_dead_ones_expired(self):
+        alive_request = self.create_active_request(self.users[0], now() - timedelta(seconds=1))
+        alive_request.mark_alive()
+        dead_request = self.create_active_request(self.users[1], now() - timedelta(seconds=1))
+        not_due_request = self.create_active_request(self.users[2], now() + timedelta(minutes=1))
+
+        self.assertEqual(PairingRequest.objects.sweep_expired(), (1, 1))
+
+        alive_request.refresh_from_db()
+        self.assertEqual(alive_request.status, PairingRequest.Status.ACTIVE)
+        self.assertGreater(alive_request.expires_at, now())
+        dead_request.refresh_from_db()
+        self.assertEqual(dead_request.status, PairingRequest.Status.EXPIRED)
+        not_due_request.refresh_from_db()
+        self.assertEqual(not_due_request.status, PairingRequest.Status.ACTIVE)
+
+        # Nothing is due anymore
+        self.assertEqual(PairingRequest.objects.sweep_expired(), (0, 0))
@@ -0,0 +1,80 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+
+from ProjectOpenDebate.common.pagination import encode_cursor
+from debate.models import Comment, Debate
+from scripts.benchmark_search import Rollback
+
+DEFAULT_COMMENT_COUNTS = (1_000, 10_000, 50_000)
+NUM_RUNS = 10
+PAGE_SIZE = 10
+
+
+def generate_comments(debate, author, num_comments, batch_size=5000):
+    """Adds comments to the debate until it has num_comments comments."""
+    num_existing = Comment.objects.filter(debate=debate).count()
+    for start in range(num_existing, num_comments, batch_size):
+        Comment.objects.bulk_create(
+            Comment(debate=debate, author=author, text=f'Benchmark comment #{i}')
+            for i in range(start, min(start + batch_size, num_comments))
+        )
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE debate_comment')
+
+
+def time_call(func):
+    durations = []
+    for _ in range(NUM_RUNS):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(durations)
+
+
+def deep_page_cursor(debate, depth):
+    """Builds the cursor of the page starting after the comment at the given depth (not timed)."""
+    comment = Comment.objects.filter(debate=debate).order_by('-date_added', '-id')[depth]
+    return encode_cursor([comment.date_added, comment.id])
+
+
+def benchmark_comments(comment_counts):
+    author = get_user_model().objects.first()
+    if author is None:
+        raise RuntimeError('At least one user is needed to author the benchmark comments')
+
+    try:
+        with transaction.atomic():
+            debate = Debate.objects.create(title=f'Comments benchmark {random.random()}', description='Benchmark')
+
+            print(f'Timing comment pages (median of {NUM_RUNS} runs, {PAGE_SIZE} comments per page)')
+            print(f'{"comments":>10}{"first page (ms)":>18}{"deep page (ms)":>18}{"deep page, offset (ms)":>26}')
+            for num_comments in sorted(comment_counts):
+                generate_comments(debate, author, num_comments)
+                depth = num_comments - PAGE_SIZE - 1
+                cursor = deep_page_cursor(debate, depth)
+
+                first_ms = time_call(lambda: Comment.objects.get_debate_comments_page(author, debate))
+                deep_ms = time_call(lambda: Comment.objects.get_debate_comments_page(author, debate, cursor=cursor))
+
+                # For reference, the same deep page using OFFSET pagination
+                comments = Comment.objects.filter(debate=debate).order_by('-date_added', '-id').select_related('author')
+                offset_page = depth // PAGE_SIZE + 1
+                offset_ms = time_call(lambda: list(Paginator(comments, PAGE_SIZE).get_page(offset_page)))
+
+                print(f'{num_comments:>10}{first_ms:>18.2f}{deep_ms:>18.2f}{offset_ms:>26.2f}')
+
+            raise Rollback
+    except Rollback:
+        print('Benchmark comments discarded.')
+
+
+def run(*args):
+    comment_counts = [int(arg) for arg in args] if args else DEFAULT_COMMENT_COUNTS
+    benchmark_comments(comment_counts)
@@ -0,0 +1,121 @@
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+
+from debate.models import Debate, Stance
+from pairing import matchmaking
+from pairing.models import PairingRequest
+from scripts.benchmark_search import Rollback
+
+DEFAULT_NUM_SEARCHERS = (1_000, 5_000)
+NUM_WORKERS = 64
+NUM_RUNS = 10
+
+# The benchmark queues use a debate id that cannot exist so that they never interfere with the real queues
+BENCHMARK_DEBATE_ID = -1
+
+
+def percentile(durations, p):
+    return sorted(durations)[min(len(durations) - 1, int(len(durations) * p / 100))]
+
+
+def clear_benchmark_queues():
+    for stance in (True, False):
+        for desired_stance in (True, False):
+            matchmaking.get_redis_client().delete(matchmaking.get_queue_key(BENCHMARK_DEBATE_ID, stance, desired_stance))
+
+
+def benchmark_queues(num_searchers):
+    """
+    Simulates num_searchers users starting an active search at the same time on a single debate, NUM_WORKERS at a time.
+    Only the matchmaking queues are timed, not the creation of the matches in the database.
+    """
+    searchers = [(request_id, random.choice((True, False)), random.choice((True, False)))
+                 for request_id in range(1, num_searchers + 1)]
+
+    def search(searcher):
+        request_id, stance, desired_stance = searcher
+        start = time.perf_counter()
+        candidate_id = matchmaking.pop_or_push(request_id, BENCHMARK_DEBATE_ID, stance, desired_stance, time.time())
+        return (time.perf_counter() - start) * 1000, candidate_id
+
+    clear_benchmark_queues()
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=NUM_WORKERS) as executor:
+            results = list(executor.map(search, searchers))
+        elapsed = time.perf_counter() - start
+    finally:
+        clear_benchmark_queues()
+
+    durations = [duration for duration, _ in results]
+    num_matches = sum(1 for _, candidate_id in results if candidate_id is not None)
+    print(f'{num_searchers:>10}{num_searchers / elapsed:>14.0f}{statistics.median(durations):>12.2f}'
+          f'{percentile(durations, 95):>12.2f}{percentile(durations, 99):>12.2f}{num_matches:>10}')
+
+
+def generate_waiting_requests(debate, num_requests, batch_size=5000):
+    """Creates num_requests active requests of users against the debate who want to debate someone for it."""
+    suffix = random.randint(0, 10 ** 9)
+    users = get_user_model().objects.bulk_create(
+        get_user_model()(username=f'benchmark_matchmaking_{suffix}_{i}', email=f'benchmark_{suffix}_{i}@example.com')
+        for i in range(num_requests)
+    )
+
+    for start in range(0, num_requests, batch_size):
+        batch = users[start:start + batch_size]
+        Stance.objects.bulk_create(Stance(user=user, debate=debate, stance=False) for user in batch)
+        PairingRequest.objects.bulk_create(
+            PairingRequest(user=user, debate=debate, desired_stance=True, status=PairingRequest.Status.ACTIVE)
+            for user in batch
+        )
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE pairing_pairingrequest')
+        cursor.execute('ANALYZE debate_stance')
+
+    return users
+
+
+def benchmark_database(num_searchers):
+    """
+    For reference, times get_best_match with num_searchers requests waiting on the same side of the debate, so that the
+    searcher finds no match (the common case during a burst). Unlike the queues, this is timed sequentially: the
+    concurrent searchers would also wait for each other's row locks.
+    """
+    try:
+        with transaction.atomic():
+            debate = Debate.objects.create(title=f'Matchmaking benchmark {random.random()}', description='Benchmark')
+            users = generate_waiting_requests(debate, num_searchers)
+
+            searcher = PairingRequest.objects.filter(user=users[0], debate=debate).get()
+            durations = []
+            for _ in range(NUM_RUNS):
+                start = time.perf_counter()
+                PairingRequest.objects.get_best_match(searcher, for_update=True)
+                durations.append((time.perf_counter() - start) * 1000)
+
+            print(f'{num_searchers:>10}{statistics.median(durations):>20.2f}')
+            raise Rollback
+    except Rollback:
+        pass
+
+
+def run(*args):
+    num_searchers_list = [int(arg) for arg in args] if args else DEFAULT_NUM_SEARCHERS
+
+    print(f'Matchmaking queues, {NUM_WORKERS} concurrent searchers on a single debate')
+    print(f'{"searchers":>10}{"searches/s":>14}{"p50 (ms)":>12}{"p95 (ms)":>12}{"p99 (ms)":>12}{"matches":>10}')
+    for num_searchers in num_searchers_list:
+        benchmark_queues(num_searchers)
+
+    print(f'\nget_best_match (database), median of {NUM_RUNS} runs')
+    print(f'{"waiting":>10}{"no match (ms)":>20}')
+    for num_searchers in num_searchers_list:
+        benchmark_database(num_searchers)
+
+    print('Benchmark requests discarded.')
@@ -0,0 +1,81 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from ProjectOpenDebate.common.pagination import paginate_keyset
+from notifications.models import Notification, NotificationType
+from scripts.benchmark_search import Rollback
+
+NUM_RUNS = 50
+PAGE_SIZE = 10
+
+
+def create_notifications(user, num_notifications):
+    notification_type = NotificationType.objects.create(
+        name='benchmark',
+        title_template='New discussion on "{debate_title}"',
+        message_template='{participant_username} wants to discuss "{debate_title}" with you.',
+        endnote_template='Reply to {participant_username} soon!'
+    )
+
+    notifications = [
+        Notification(
+            user=user,
+            notification_type=notification_type,
+            data={'debate_title': f'Benchmark debate #{i}', 'participant_username': f'benchmark_user_{i}'},
+            url_name='list_notifications',
+        )
+        for i in range(num_notifications)
+    ]
+    for notification in notifications:
+        notification.render_text()
+
+    # Note: bulk_create does not send the notifications through the WebSocket
+    Notification.objects.bulk_create(notifications)
+
+
+def time_call(func):
+    durations = []
+    for _ in range(NUM_RUNS):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(durations)
+
+
+def benchmark_notifications():
+    user = get_user_model().objects.first()
+    if user is None:
+        raise RuntimeError('At least one user is needed to receive the benchmark notifications')
+
+    try:
+        with transaction.atomic():
+            create_notifications(user, PAGE_SIZE)
+
+            def get_page():
+                return paginate_keyset(user.notification_set.all(), ('-created_at', '-id'), page_size=PAGE_SIZE)
+
+            def render_page():
+                context = {'page': get_page(), 'is_dropdown': True, 'unread_only': False}
+                return render_to_string('notifications/notifications_list_page.html', context)
+
+            def format_texts():
+                for notification in get_page():
+                    notification.render_text()
+
+            print(f'Timing a {PAGE_SIZE}-item dropdown page (median of {NUM_RUNS} runs)')
+            print(f'{"fetch page only":<40}{time_call(get_page):>10.2f} ms')
+            print(f'{"fetch page + format texts":<40}{time_call(format_texts):>10.2f} ms')
+            print(f'{"render page":<40}{time_call(render_page):>10.2f} ms')
+
+            raise Rollback
+    except Rollback:
+        print('Benchmark notifications discarded.')
+
+
+def run(*args):
+    benchmark_notifications()
@@ -0,0 +1,49 @@
+import json
+import os
+import random
+import tempfile
+
+from django.db import transaction
+
+from scripts.benchmark_search import load_vocabulary, Rollback
+from scripts.populate_debates import populate_debates
+
+DEFAULT_NUM_SUBJECTS = 50_000
+SUBJECTS_PER_CATEGORY = 500
+
+
+def generate_debate_list(vocabulary, num_subjects):
+    """Generates a debate list with the same structure as debate_list.json."""
+    json_data = []
+    for start in range(0, num_subjects, SUBJECTS_PER_CATEGORY):
+        category = f'Benchmark {start // SUBJECTS_PER_CATEGORY}'
+        json_data.append({
+            'category': category,
+            'debate_subjects': [
+                {
+                    # Reuse a few titles to exercise the slug suffixes
+                    'subject': f"{' '.join(random.choices(vocabulary, k=5))[:80]} {i % (SUBJECTS_PER_CATEGORY // 2)}",
+                    'category': category,
+                    'description': ' '.join(random.choices(vocabulary, k=60))
+                }
+                for i in range(start, min(start + SUBJECTS_PER_CATEGORY, num_subjects))
+            ]
+        })
+
+    return json_data
+
+
+def run(*args):
+    num_subjects = int(args[0]) if args else DEFAULT_NUM_SUBJECTS
+    vocabulary = load_vocabulary(os.path.join(os.path.dirname(__file__), 'debate_list.json'))
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json') as debate_list_file:
+        json.dump(generate_debate_list(vocabulary, num_subjects), debate_list_file)
+        debate_list_file.flush()
+
+        try:
+            with transaction.atomic():
+                populate_debates(debate_list_file.name)
+                raise Rollback
+        except Rollback:
+            print('Benchmark debates discarded.')
@@ -0,0 +1,83 @@
+import json
+import os
+import random
+import statistics
+import time
+
+from django.db import connection, transaction
+
+from debate.models import Debate
+
+DEFAULT_NUM_DEBATES = 100_000
+NUM_RUNS = 10
+QUERIES = ['healthcare', 'social media privacy', 'climate change policy', 'pineapple pizza', 'xyzzy']
+
+
+class Rollback(Exception):
+    """Raised at the end of the benchmark to discard the generated debates."""
+
+
+def load_vocabulary(debate_list_file):
+    with open(debate_list_file) as f:
+        json_data = json.load(f)
+
+    words = set()
+    for debate_categories in json_data:
+        for debate_object in debate_categories['debate_subjects']:
+            words.update(debate_object['subject'].split())
+            words.update(debate_object['description'].split())
+
+    return sorted(words)
+
+
+def generate_debates(vocabulary, num_debates, batch_size=5000):
+    print(f'Generating {num_debates} debates...')
+    for start in range(0, num_debates, batch_size):
+        debates = []
+        for i in range(start, min(start + batch_size, num_debates)):
+            title = ' '.join(random.choices(vocabulary, k=6))[:80]
+            debates.append(Debate(
+                title=f'{title} #{i}',
+                slug=f'benchmark-search-{i}',
+                description=' '.join(random.choices(vocabulary, k=60))
+            ))
+        Debate.objects.bulk_create(debates)  # The search vector is filled in by the database trigger
+
+    # Make sure the planner knows about the new rows before timing anything
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE debate_debate')
+
+
+def time_query(query, use_search_vector):
+    durations = []
+    for _ in range(NUM_RUNS):
+        start = time.perf_counter()
+        list(Debate.objects.search(query, use_search_vector=use_search_vector)[:10])
+        durations.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(durations)
+
+
+def benchmark_search(num_debates):
+    vocabulary = load_vocabulary(os.path.join(os.path.dirname(__file__), 'debate_list.json'))
+
+    try:
+        with transaction.atomic():
+            generate_debates(vocabulary, num_debates)
+            total_debates = Debate.objects.count()
+
+            print(f'Timing search over {total_debates} debates (median of {NUM_RUNS} runs, first page of results)')
+            print(f'{"query":<25}{"stored vector (ms)":>20}{"rebuilt vector (ms)":>22}')
+            for query in QUERIES:
+                stored_ms = time_query(query, use_search_vector=True)
+                rebuilt_ms = time_query(query, use_search_vector=False)
+                print(f'{query:<25}{stored_ms:>20.2f}{rebuilt_ms:>22.2f}')
+
+            raise Rollback
+    except Rollback:
+        print('Benchmark debates discarded.')
+
+
+def run(*args):
+    num_debates = int(args[0]) if args else DEFAULT_NUM_DEBATES
+    benchmark_search(num_debates)
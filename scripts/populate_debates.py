@@ -1,31 +1,71 @@
 import os
 import json
-from django.db import IntegrityError
+import time
+from itertools import islice
+
 from debate.models import Debate
 from tqdm import tqdm
 
+BATCH_SIZE = 1000
+
+
+def iter_debate_subjects(json_data):
+    """Yields (title, description) for every debate subject of every category."""
+    for debate_categories in json_data:
+        for debate_object in debate_categories['debate_subjects']:
+            yield debate_object['subject'], debate_object['description']
+
 
-def populate_debates(debate_list_file):
+def iter_batches(iterable, batch_size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def populate_debates(debate_list_file, batch_size=BATCH_SIZE):
     with open(debate_list_file) as f:
         json_data = json.load(f)
 
-    for i, debate_categories in enumerate(json_data):
-        category = debate_categories['category']
-        debate_subjects = debate_categories['debate_subjects']
-        print(f'Populating debates for category: {category} ({i + 1}/{len(json_data)})')
-        for debate_object in tqdm(debate_subjects):
-            title = debate_object['subject']
-            description = debate_object['description']
-
-            try:
-                # Create the debate
-                # Note: we cannot use bulk because we need the save method to generate the slug and update the search vector
-                # Note: there is probably a better way to do this, but this is a simple and enough for now
-                Debate.objects.create(title=title, description=description)
-            except IntegrityError:
-                print(f"Debate with title '{title}' already exists. Skipping...")
-
-
-def run():
-    debate_list_file = os.path.join(os.path.dirname(__file__), 'debate_list.json')
+    num_subjects = sum(len(debate_categories['debate_subjects']) for debate_categories in json_data)
+    print(f'Importing {num_subjects} debates from {len(json_data)} categories')
+
+    # Fetch the existing titles once so that we can skip duplicates in memory
+    existing_titles = set(Debate.objects.values_list('title', flat=True))
+    num_debates_before = len(existing_titles)
+
+    start = time.perf_counter()
+    num_skipped = 0
+    num_attempted = 0
+    with tqdm(total=num_subjects, unit='debate') as progress:
+        for batch in iter_batches(iter_debate_subjects(json_data), batch_size):
+            new_subjects = []
+            for title, description in batch:
+                if title in existing_titles:
+                    num_skipped += 1
+                    continue
+
+                existing_titles.add(title)
+                new_subjects.append((title, description))
+
+            # Allocate the slugs of the whole batch with a single query
+            slugs = Debate.objects.allocate_slugs([title for title, _ in new_subjects])
+            debates = [
+                Debate(title=title, slug=slug, description=description)
+                for (title, description), slug in zip(new_subjects, slugs)
+            ]
+            num_attempted += len(debates)
+
+            # Note: the search vector is filled in by the database trigger, even for bulk inserts
+            # Note: ignore_conflicts covers debates created concurrently by another process since we fetched the slugs
+            Debate.objects.bulk_create(debates, ignore_conflicts=True)
+            progress.update(len(batch))
+
+    elapsed = time.perf_counter() - start
+    num_created = Debate.objects.count() - num_debates_before
+    print(f"Created {num_created} debates in {elapsed:.2f}s ({num_created / elapsed:.0f} debates/s). "
+          f"Skipped {num_skipped} existing titles and {num_attempted - num_created} conflicts.")
+
+
+def run(*args):
+    debate_list_file = args[0] if args else os.path.join(os.path.dirname(__file__), 'debate_list.json')
     populate_debates(debate_list_file)
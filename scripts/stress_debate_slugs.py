@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+
+from debate.models import Debate
+
+DEFAULT_NUM_THREADS = 16
+DEFAULT_NUM_DEBATES = 64
+BASE_TITLE = 'Slug allocation stress test'
+
+
+def create_debate(title):
+    """Creates a debate from a worker thread. Each thread uses its own database connection."""
+    try:
+        return Debate.objects.create(title=title, description='Created by scripts/stress_debate_slugs.py').slug
+    finally:
+        connection.close()
+
+
+def stress_debate_slugs(num_threads, num_debates):
+    # All the titles are unique, but they all slugify to the same base slug
+    titles = [f"{BASE_TITLE}{'!' * i}" for i in range(num_debates)]
+
+    print(f'Creating {num_debates} debates with the same base slug from {num_threads} threads...')
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        futures = [executor.submit(create_debate, title) for title in titles]
+
+    errors = [future.exception() for future in futures if future.exception()]
+    slugs = [future.result() for future in futures if not future.exception()]
+
+    print(f'Created {len(slugs)} debates ({len(set(slugs))} unique slugs), {len(errors)} errors')
+    for error in errors:
+        print(f'  {type(error).__name__}: {error}')
+
+    # Clean up
+    Debate.objects.filter(title__in=titles).delete()
+
+    if errors or len(set(slugs)) != num_debates:
+        raise RuntimeError('Slug allocation is not collision-free')
+
+
+def run(*args):
+    num_threads = int(args[0]) if len(args) > 0 else DEFAULT_NUM_THREADS
+    num_debates = int(args[1]) if len(args) > 1 else DEFAULT_NUM_DEBATES
+    stress_debate_slugs(num_threads, num_debates)
@@ -132,6 +132,29 @@ class WebSocketManager {
         });
     }
 
+    set_notifications_read_in_bulk(is_read, scope = {}) {
+        this.send({
+            'stream': 'notification',
+            'payload': {
+                'event_type': 'bulk_set_read',
+                'data': {
+                    ...scope,
+                    'is_read': is_read
+                }
+            }
+        });
+    }
+
+    delete_notifications_in_bulk(scope = {}) {
+        this.send({
+            'stream': 'notification',
+            'payload': {
+                'event_type': 'bulk_delete',
+                'data': scope
+            }
+        });
+    }
+
     read_messages(currentDiscussionId, through_load_discussion = false) {
         this.send({
             'stream': 'discussion',